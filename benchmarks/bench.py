@@ -0,0 +1,170 @@
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from rich import print
+import typer
+from typing_extensions import Annotated
+from typing import List, Optional
+
+# Get the absolute path of the project's root directory
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Add the 'src' and 'tests' directories to the Python path
+sys.path.append(os.path.join(project_root, 'src'))
+sys.path.append(os.path.join(project_root, 'tests'))
+from contexts import Contexts, ParseEngine
+from engine import Engine
+from preprocess import PROFILES
+from profiling import Profiler, set_profiler
+from fake_model import FakeChatModel
+from fixtures import write_pdf, write_docx, write_txt
+
+# Offline benchmarks of the contextify pipeline. The chat model is the deterministic fake from the tests with an
+# artificial latency, so results measure our own overhead and concurrency rather than the provider.
+
+app = typer.Typer()
+
+TEMPLATE = {
+    "content": "Dear [company],\n\nI am applying for the [role] position. [why this company]\n\n[closing]",
+    "description": "cover letter template",
+    "metadata": {"to_substitute": [], "brackets": ("[", "]")}
+}
+
+def paragraphs(name, n):
+    return [f"{name} paragraph {i}: " + " ".join(f"word{(i * 7 + j) % 97}" for j in range(60)) for i in range(n)]
+
+def quiet():
+    # The pipeline reports progress with rich prints, which would drown out the results
+    return contextlib.redirect_stdout(io.StringIO())
+
+def run_pipeline(tmpdir, nvariable, latency, concurrency, preprocess_profile = "thorough"):
+    fixed_contexts = [
+        {"description": "resume", "path": write_txt(os.path.join(tmpdir, "resume.txt"), paragraphs("resume", 8))},
+        {"description": "portfolio", "path": write_txt(os.path.join(tmpdir, "portfolio.txt"), paragraphs("portfolio", 4))},
+    ]
+    variable_contexts = [
+        [{"description": "job posting", "path": write_txt(os.path.join(tmpdir, f"posting{i}.txt"), paragraphs(f"posting {i}", 6))}]
+        for i in range(nvariable)
+    ]
+    model = FakeChatModel(latency = latency)
+    engine = Engine(model, concurrency = concurrency, preprocess_profile = preprocess_profile)
+    try:
+        start = time.perf_counter()
+        with quiet():
+            responses = asyncio.run(engine.run(fixed_contexts, variable_contexts, TEMPLATE))
+        wall = time.perf_counter() - start
+    finally:
+        engine.close()
+    failures = [response for response in responses if isinstance(response, BaseException)]
+    if len(failures) > 0:
+        raise failures[0]
+    return wall, model.calls
+
+def bench_throughput(sizes, latency, concurrency, preprocess_profile):
+    results = []
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            wall, calls = run_pipeline(tmpdir, n, latency, concurrency, preprocess_profile)
+        results.append({"variable_contexts": n, "wall": wall, "postings_per_second": n / wall, "llm_calls": calls})
+        print(f"[bold]throughput[/bold] {preprocess_profile} {n} postings: {wall:.3f}s, {n / wall:.2f} postings/s, {calls} LLM calls")
+    return results
+
+def bench_nodes(nvariable, latency, concurrency, preprocess_profile):
+    profiler = Profiler()
+    set_profiler(profiler)
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            run_pipeline(tmpdir, nvariable, latency, concurrency, preprocess_profile)
+    finally:
+        set_profiler(None)
+    results = {}
+    for entry in profiler.summary():
+        if entry["kind"] == "node":
+            results[entry["name"]] = {key: entry[key] for key in ["count", "wall_p50", "wall_p95", "wall_total"]}
+            print(f"[bold]node[/bold] {preprocess_profile} {entry['name']}: p50 {entry['wall_p50']:.4f}s, p95 {entry['wall_p95']:.4f}s")
+    return results
+
+def bench_parse(nfiles, pages, workers):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        writers = {
+            "txt": lambda fname, i: write_txt(fname, paragraphs(f"file {i}", pages)),
+            "docx": lambda fname, i: write_docx(fname, paragraphs(f"file {i}", pages)),
+            "pdf": lambda fname, i: write_pdf(fname, paragraphs(f"file {i}", pages)),
+        }
+        for ftype, write in writers.items():
+            contexts = [{"description": f"{ftype} {i}", "path": write(os.path.join(tmpdir, f"file{i}.{ftype}"), i)} for i in range(nfiles)]
+            engine = ParseEngine(max_workers = workers)
+            try:
+                start = time.perf_counter()
+                with quiet():
+                    Contexts(contexts, engine = engine)
+                wall = time.perf_counter() - start
+            finally:
+                engine.close()
+            results[ftype] = {"files": nfiles, "pages": pages, "wall": wall, "files_per_second": nfiles / wall}
+            print(f"[bold]parse[/bold] {ftype}: {nfiles} files in {wall:.3f}s, {nfiles / wall:.1f} files/s")
+    return results
+
+def regressions(results, baseline, tolerance):
+    # Compares every wall time against the baseline and returns the ones that got slower by more than `tolerance`
+    found = []
+    def walk(path, current, previous):
+        if isinstance(current, dict) and isinstance(previous, dict):
+            for key in current:
+                if key in previous:
+                    walk(f"{path}.{key}" if path else key, current[key], previous[key])
+        elif isinstance(current, list) and isinstance(previous, list):
+            for i, (c, p) in enumerate(zip(current, previous)):
+                walk(f"{path}[{i}]", c, p)
+        elif path.split(".")[-1].startswith("wall") and isinstance(current, (int, float)) and previous > 0:
+            if current > previous * (1 + tolerance):
+                found.append((path, previous, current))
+    walk("", results, baseline)
+    return found
+
+@app.command()
+def run(
+        output: Annotated[str, typer.Option("--output", "-o", help= "File the JSON results are written to")] = "benchmarks/results.json",
+        sizes: Annotated[List[int], typer.Option("--size", "-n", help= "Numbers of variable contexts to measure throughput with")] = [1, 4, 16],
+        latency: Annotated[float, typer.Option("--latency", help= "Artificial latency of every fake LLM call in seconds")] = 0.05,
+        concurrency: Annotated[int, typer.Option("--concurrency", "-c", help= "Maximum number of in-flight LLM calls")] = 16,
+        parse_files: Annotated[int, typer.Option("--parse-files", help= "Number of generated files per file type in the parse benchmark")] = 16,
+        parse_pages: Annotated[int, typer.Option("--parse-pages", help= "Number of pages or paragraphs per generated file")] = 20,
+        parse_workers: Annotated[Optional[int], typer.Option("--parse-workers", help= "Number of parser processes")] = None,
+        baseline: Annotated[Optional[str], typer.Option("--baseline", help= "Results of an earlier run to compare against; exits with 1 on a regression")] = None,
+        tolerance: Annotated[float, typer.Option("--tolerance", help= "Relative slowdown against the baseline that counts as a regression")] = 0.25
+    ):
+    # Relative paths in the sources (e.g. src/prompts.yaml) assume the project root as working directory
+    output = os.path.abspath(output)
+    baseline = os.path.abspath(baseline) if baseline != None else None
+    os.chdir(project_root)
+
+    results = {
+        "config": {"latency": latency, "concurrency": concurrency},
+        # Both preprocess profiles are measured so the latency difference between them shows up in the results
+        "throughput": {p: bench_throughput(sizes, latency, concurrency, p) for p in PROFILES},
+        "nodes": {p: bench_nodes(max(sizes), latency, concurrency, p) for p in PROFILES},
+        "parse": bench_parse(parse_files, parse_pages, parse_workers),
+    }
+
+    os.makedirs(os.path.dirname(output), exist_ok = True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent = 2)
+    print(f"Results written to {output}")
+
+    if baseline != None:
+        with open(baseline) as f:
+            found = regressions(results, json.load(f), tolerance)
+        for path, previous, current in found:
+            print(f"[bold red]Regression[/bold red] {path}: {previous:.4f}s -> {current:.4f}s")
+        if len(found) > 0:
+            raise typer.Exit(code = 1)
+
+if __name__ == "__main__":
+    app()
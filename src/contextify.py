@@ -2,8 +2,9 @@ from typing import Annotated, Literal, TypedDict, List, Union, Tuple, Dict, Opti
 from rich import print
 from langgraph.graph import StateGraph, END
 from langchain_core.messages import AnyMessage, SystemMessage, HumanMessage, ToolMessage, AIMessage
+from langchain_core.runnables import RunnableConfig
 import operator
-import concurrent.futures
+import asyncio
 from omegaconf import OmegaConf
 
 from pydantic import BaseModel, Field
@@ -17,6 +18,13 @@ project_root = os.path.dirname(os.path.abspath(__file__))
 src_dir = os.path.join(project_root, 'src')
 sys.path.append(src_dir)
 from preprocess import Context, Preprocess
+from retrieval import RelevanceIndex
+from tokens import count_tokens
+from templates import extract_bracketed, template_key, TemplateAnalysisCache
+from checkpoint import resume_or_invoke
+from profiling import profiled
+from runlog import describe_contexts
+from serialize import serialize_contexts
 
 class RelatedInformation(BaseModel):
     information_of_interest: str = Field(description = "This is information of interest.")
@@ -37,10 +45,11 @@ class FilledTemplates(BaseModel):
 class ContextifierAgentState(BaseModel):
     contexts: List[Context] = Field(description= "A list of Context objects")# descriptions: guidelines for acting on content
     template: Template = Field(description = "The template that we want to fill out with information in contexts")
-    output: Optional[FilledTemplates] = Field(description = "The final output to the contextifier agent")
+    output: Optional[FilledTemplates] = Field(default = None, description = "The final output to the contextifier agent")
+    relevant_contexts: Optional[List[Context]] = Field(default = None, description = "The passages of contexts relevant to the template, used in place of `contexts` in prompts")
 
 class Contextifier:
-    def __init__(self, model, system=None, logf=None):
+    def __init__(self, model, system=None, run_log=None, preprocess=None, top_k=None, checkpointer=None, noutputs=3, parallel=False, first=None):
         self.__prompts = OmegaConf.load('src/prompts.yaml')['contextifier']
 
         if system != None:
@@ -73,16 +82,42 @@ class Contextifier:
         #     {END: END, "...": "..."}
         # )
 
-        self.graph = graph.compile()
+        self.graph = graph.compile(checkpointer=checkpointer)
         self.model = model
-        self.logf = logf
-        if self.logf != None:
-             with open(self.logf, "w") as f:
-                 pass
-
-        self.__preprocess = Preprocess(model, logf=self.logf)
-
-    def preprocessor(self, state: ContextifierAgentState):
+        # Structured events of every node go to `run_log` (a `runlog.RunLog`), if any
+        self.run_log = run_log
+
+        self.__preprocess = preprocess if preprocess != None else Preprocess(model, run_log=self.run_log)
+
+        # When set, prompts only include the `top_k` most relevant passages for each text to substitute
+        self.top_k = top_k
+        self.prompt_tokens_saved = 0
+
+        # The template does not change between runs, so its analysis is shared by every run of this Contextifier
+        self.template_analysis = TemplateAnalysisCache()
+
+        # In parallel mode each of the `noutputs` filled templates is its own call, and the node returns as soon as
+        # `first` acceptable ones are done
+        self.noutputs = noutputs
+        self.parallel = parallel
+        self.first = first
+
+    def invoke(self, state: ContextifierAgentState, thread_id=None, on_candidate=None, index=None):
+        return asyncio.run(self.ainvoke(state, thread_id, on_candidate, index))
+
+    async def ainvoke(self, state: ContextifierAgentState, thread_id=None, on_candidate=None, index=None):
+        # `on_candidate(i, filled_template)` is called as each filled template is ready, in completion order. `index` is
+        # a `relevance_index` of contexts shared by many runs (e.g. the fixed contexts), which retrieval extends with
+        # the rest of the contexts of this run instead of indexing every context again.
+        config = {"configurable": {"on_candidate": on_candidate, "relevance_index": index}}
+        # With a checkpointer, `thread_id` identifies the run so that it can be resumed after a crash
+        if thread_id != None and self.graph.checkpointer != None:
+            config["configurable"]["thread_id"] = thread_id
+            return await resume_or_invoke(self.graph, state, config)
+        return await self.graph.ainvoke(state, config)
+
+    @profiled("contextifier")
+    async def preprocessor(self, state: ContextifierAgentState, config: RunnableConfig):
         to_process_contexts = []
         processed_contexts = []
 
@@ -95,15 +130,26 @@ class Contextifier:
                 processed_contexts.append(context)
 
         if len(to_process_contexts) > 0:
-            result = self.__preprocess.invoke(to_process_contexts)
+            thread_id = config.get("configurable", {}).get("thread_id")
+            result = await self.__preprocess.ainvoke(to_process_contexts, thread_id = f"{thread_id}/preprocess" if thread_id != None else None)
             to_process_contexts = result["contexts"]
 
-        self.append_to_log(f'preprocessor: preprocessed contexts.\n{processed_contexts + to_process_contexts}')
+        self.log("preprocessed", contexts = describe_contexts(processed_contexts + to_process_contexts))
         return {
             "contexts": processed_contexts + to_process_contexts
         }
 
-    def extractor(self, state: ContextifierAgentState):
+    async def extractor(self, state: ContextifierAgentState):
+        key = template_key(state.template.content, state.template.metadata.brackets)
+        return await self.template_analysis.get(key, lambda: self.extract(state))
+
+    async def extract(self, state: ContextifierAgentState):
+        to_replace = extract_bracketed(state.template.content, state.template.metadata.brackets)
+        if to_replace != None:
+            self.log("extracted", to_replace = to_replace, model = False)
+            return to_replace
+
+        # Nested or unbalanced brackets are left to the model
         class ToReplace(BaseModel):
             to_replace: List[str] = Field(description = "Text inside the template contained within the brackets, {brackets}".format(brackets = state.template.metadata.brackets))
 
@@ -112,16 +158,17 @@ class Contextifier:
 
         message = HumanMessage(content=self.__prompts["components"]["extractor"]["human_prompt"].format(description=state.template.description, template=state.template.content, brackets=state.template.metadata.brackets))
         messages = self.system + [SystemMessage(content=EXTRACTOR_PROMPT)] + [message]
-        response = self.model.with_structured_output(ToReplace).invoke(messages)
+        response = await self.model.with_structured_output(ToReplace).ainvoke(messages)
             
         print('Done with [bold purple]extractor[/bold purple]')
 
-        self.append_to_log(f'extractor: identified and extracted text to replace in template.\n{response.to_replace}"')
+        self.log("extracted", to_replace = response.to_replace, model = True)
         return response.to_replace
         
     # TODO: Improve the tagger
-    def tagger(self, state: ContextifierAgentState):
-        extracted_template = self.extractor(state)
+    @profiled("contextifier")
+    async def tagger(self, state: ContextifierAgentState, config: RunnableConfig):
+        extracted_template = await self.extractor(state)
 
         class ToSubstitute(BaseModel):
             to_substitute: List[RelatedInformation] = Field(description= "The related information for each of the sections/areas that will be filled/replaced with information from contexts") 
@@ -130,38 +177,135 @@ class Contextifier:
         TAGGER_PROMPT = self.__prompts["components"]["tagger"]["system_prompt"]
 
 
-        message = HumanMessage(content=self.__prompts["components"]["tagger"]["human_prompt"].format(contexts = state.contexts, text_to_substitute=extracted_template))
+        relevant_contexts = self.retrieve(state.contexts, extracted_template, config.get("configurable", {}).get("relevance_index"))
+        contexts = relevant_contexts if relevant_contexts != None else state.contexts
+
+        message = HumanMessage(content=self.__prompts["components"]["tagger"]["human_prompt"].format(contexts = serialize_contexts(contexts), text_to_substitute=extracted_template))
         messages = self.system + [SystemMessage(content=TAGGER_PROMPT)] + [message]
-        response = self.model.with_structured_output(ToSubstitute).invoke(messages)
+        response = await self.model.with_structured_output(ToSubstitute).ainvoke(messages)
 
         # TODO: update the state
         state.template.metadata.to_substitute = response.to_substitute
 
         # Log changes
-        self.append_to_log(f'tagger: tagged each string to replace in the template with related information from Contexts.\n{response}"')
+        self.log("tagged", to_substitute = response.to_substitute)
         return {
-            "template": state.template
+            "template": state.template,
+            "relevant_contexts": relevant_contexts
         }
 
-    def append_to_log(self, text):
-        if self.logf == None:
-            return  
-        with open(self.logf, "a") as f:
-            f.write(text + "\n") 
+    def relevance_index(self, contexts):
+        return RelevanceIndex(contexts) if self.top_k != None else None
 
-    def contextifier(self, state: ContextifierAgentState, noutputs = 3):
+    def retrieve(self, contexts, queries, index=None):
+        if self.top_k == None:
+            return None
+        # Only the contexts that `index` does not already cover are indexed
+        indexed = index.contexts if index != None else []
+        if index != None and [(c.description, c.content) for c in contexts[:len(indexed)]] == [(c.description, c.content) for c in indexed]:
+            index = index.extended(contexts[len(indexed):])
+        else:
+            index = RelevanceIndex(contexts)
+        relevant_contexts = index.top_contexts(queries, self.top_k)
+        if len(relevant_contexts) == 0:
+            return None
+
+        # The contexts are formatted into both the tagger and the contextifier prompts
+        saved = 2 * (count_tokens(serialize_contexts(contexts)) - count_tokens(serialize_contexts(relevant_contexts)))
+        self.prompt_tokens_saved += saved
+        print(f"\t-> retrieval kept {len(relevant_contexts)} contexts, saving ~{saved} prompt tokens")
+        self.log("retrieved", top_k = self.top_k, prompt_tokens_saved = saved, contexts = describe_contexts(relevant_contexts))
+        return relevant_contexts
+
+    def log(self, event, **fields):
+        if self.run_log != None:
+            self.run_log.log(event, **fields)
+
+    @profiled("contextifier")
+    async def contextifier(self, state: ContextifierAgentState, config: RunnableConfig):
         print('Invoking [bold dark_orange]contextifier[/bold dark_orange]')
         CONTEXTIFIER_PROMPT = self.__prompts["components"]["contextifier"]["system_prompt"]
+        on_candidate = config.get("configurable", {}).get("on_candidate")
 
-        message = HumanMessage(content=self.__prompts["components"]["contextifier"]["human_prompt"].format(template = state.template.content, brackets = state.template.metadata.brackets, contexts = state.contexts, noutputs = noutputs))
-        messages = [SystemMessage(content=CONTEXTIFIER_PROMPT)] + [message]
-        response = self.model.with_structured_output(FilledTemplates).invoke(messages)
+        contexts = state.relevant_contexts if state.relevant_contexts != None else state.contexts
+        human_prompt = self.__prompts["components"]["contextifier"]["human_prompt"].format(template = state.template.content, brackets = state.template.metadata.brackets, contexts = serialize_contexts(contexts), noutputs = self.noutputs)
+        if self.parallel:
+            response = await self.generate_candidates(state, CONTEXTIFIER_PROMPT, human_prompt, on_candidate)
+        else:
+            messages = [SystemMessage(content=CONTEXTIFIER_PROMPT)] + [HumanMessage(content=human_prompt)]
+            response = await self.model.with_structured_output(FilledTemplates).ainvoke(messages)
+            if on_candidate != None:
+                for i, filled_template in enumerate(response.filled_templates):
+                    on_candidate(i, filled_template)
         print('Done with [bold dark_orange]contextifier[/bold dark_orange]')
 
-        self.append_to_log(f'contextifier: state of template.\n{state.template}"')
-        self.append_to_log(f'contextifier: created {noutputs} filled templates with information in the contexts.\n{response}"')
+        self.log("filled", template = state.template, filled_templates = response.filled_templates)
         return {'output': response}         
 
+    async def generate_candidates(self, state: ContextifierAgentState, system_prompt, human_prompt, on_candidate=None):
+        # Every candidate is requested separately (and numbered so that cached responses stay distinct), and the
+        # candidates are collected in completion order. Once `first` acceptable candidates are in, the rest are cancelled.
+        CANDIDATE_PROMPT = self.__prompts["components"]["contextifier"]["candidate_prompt"]
+
+        async def generate(i):
+            message = HumanMessage(content=human_prompt + CANDIDATE_PROMPT.format(candidate = i + 1, noutputs = self.noutputs))
+            response = await self.model.with_structured_output(FilledTemplates).ainvoke([SystemMessage(content=system_prompt), message])
+            return response.filled_templates[0] if len(response.filled_templates) > 0 else None
+
+        fields = await self.extractor(state)
+        tasks = [asyncio.ensure_future(generate(i)) for i in range(self.noutputs)]
+        filled_templates = []
+        # Candidates that still contain a template field, kept in case no candidate fills every field
+        unfilled = []
+        errors = []
+        try:
+            for task in asyncio.as_completed(tasks):
+                try:
+                    filled_template = await task
+                except Exception as inst:
+                    errors.append(inst)
+                    continue
+                if not self.acceptable(state, fields, filled_template):
+                    if filled_template != None and filled_template.strip() != "":
+                        unfilled.append(filled_template)
+                    continue
+                filled_templates.append(filled_template)
+                if on_candidate != None:
+                    on_candidate(len(filled_templates) - 1, filled_template)
+                if self.first != None and len(filled_templates) >= self.first:
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions = True)
+
+        if len(filled_templates) == 0 and len(unfilled) > 0:
+            # Partially filled templates are still worth reviewing, but never silently
+            print(f"[bold red]No candidate filled every field of the template[/bold red], keeping {len(unfilled[:self.first])} partially filled ones")
+            self.log("unfilled", candidates = len(unfilled), errors = [repr(inst) for inst in errors])
+            filled_templates = unfilled[:self.first]
+            if on_candidate != None:
+                for i, filled_template in enumerate(filled_templates):
+                    on_candidate(i, filled_template)
+        if len(filled_templates) == 0:
+            if len(errors) > 0:
+                raise errors[0]
+            raise ValueError("Every candidate filled template was empty")
+        return FilledTemplates(filled_templates = filled_templates)
+
+    def acceptable(self, state: ContextifierAgentState, fields, filled_template):
+        # A candidate that still contains a bracketed field of the template (`fields`, as extracted from the template
+        # itself rather than as worded by the tagger) was not completely filled
+        if filled_template == None or filled_template.strip() == "":
+            return False
+        brackets = state.template.metadata.brackets
+        remaining = extract_bracketed(filled_template, brackets)
+        if remaining == None:
+            # Brackets in the filled text itself are unbalanced, so only look for the fields verbatim
+            left, right = brackets
+            return not any(f"{left}{field}{right}" in filled_template for field in fields)
+        return len(set(remaining) & set(fields)) == 0
+
     def gatherer(self, state: ContextifierAgentState):
         pass
 
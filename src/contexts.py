@@ -1,21 +1,45 @@
 import re
-import docx 
-from pypdf import PdfReader
-from urllib.request import urlopen
-from langchain_community.document_transformers import Html2TextTransformer
-from langchain_community.document_loaders import AsyncHtmlLoader
 import concurrent
-from rich import print
-import requests
+import concurrent.futures
+import threading
+import asyncio
+import contextlib
+import copy
 import functools
-import html2text
+import multiprocessing
+import time
+from rich import print
 from typing_extensions import TypedDict, List
-from pydantic import TypeAdapter
 
 import os
 
+from profiling import record_parse
+
 class Contexts:
-    def __init__(self, contexts, delim = ","):
+    def __init__(self, contexts, delim = ",", cache = None, engine = None):
+        keys = self.validate(contexts)
+        print(f"[bold bright_red]Processing Contexts[/bold bright_red]")
+        
+        # NOTE: we do not want to reparse (description, path) pairs that we already have handled
+        def init_context(key):
+            description, path = key
+            print(f"\t-> processing Context: {path}")
+            return Context(description, path, cache = cache, engine = engine)
+
+        unique_keys = list(dict.fromkeys(keys))
+        with concurrent.futures.ThreadPoolExecutor(max_workers = 5) as executor:
+            parsed = dict(zip(unique_keys, executor.map(init_context, unique_keys)))
+        self.contexts = [parsed[key] for key in keys]
+
+    @classmethod
+    async def acreate(cls, contexts, cache = None, semaphore = None, engine = None):
+        # Parses on the event loop's default executor, with at most `semaphore` parses (and fetches) in flight
+        return await Ingestion(cache = cache, semaphore = semaphore, engine = engine).contexts(contexts)
+
+    @staticmethod
+    def validate(contexts):
+        from pydantic import TypeAdapter
+
         class ContextInput(TypedDict): 
             description: str
             path: str
@@ -29,18 +53,7 @@ class Contexts:
         except:
             raise ValueError("`contexts` is not of the correct structure. Double-check contextf.")
 
-        self.contexts = []
-        print(f"[bold bright_red]Processing Contexts[/bold bright_red]")
-        
-        # NOTE: we need to cache because we do not want to reparse strings that we already have handled
-        @functools.cache
-        def init_context(context):
-            print(f"\t-> processing Context: {context['path']}")
-            return Context(context['description'], context['path'])
-
-        with concurrent.futures.ThreadPoolExecutor(max_workers = 5) as executor:
-            for context in executor.map(init_context, contexts):
-                self.contexts.append(context)
+        return [(context['description'], context['path']) for context in contexts]
     
     def __str__(self):
         return str([str(context) for context in self.contexts])
@@ -48,53 +61,149 @@ class Contexts:
     def to_dict(self):
         return {contexts: [context.to_dict() for context in self.contexts]}
         
-# NOTE: maybe I want to extend this design to allow any generic type of parser
+# Parses every unique path of a run once, whichever contexts (and descriptions) it appears in. `submit` starts parsing
+# the paths of a set of contexts in the background and `contexts` waits for just that set, so a set can be processed
+# as soon as its own paths are parsed while the paths of later sets are still being fetched and parsed.
+class Ingestion:
+    def __init__(self, cache = None, semaphore = None, engine = None):
+        self.cache = cache
+        self.semaphore = semaphore
+        self.engine = engine
+        self.tasks = {}
+
+    async def parse(self, description, path):
+        async with self.semaphore if self.semaphore != None else contextlib.nullcontext():
+            print(f"\t-> processing Context: {path}")
+            return await asyncio.to_thread(Context, description, path, cache = self.cache, engine = self.engine)
+
+    def submit(self, contexts):
+        keys = Contexts.validate(contexts)
+        for description, path in keys:
+            if path not in self.tasks:
+                self.tasks[path] = asyncio.ensure_future(self.parse(description, path))
+        return keys
+
+    async def contexts(self, contexts):
+        keys = self.submit(contexts)
+        print(f"[bold bright_red]Processing Contexts[/bold bright_red]")
+        parsed = dict(zip(keys, await asyncio.gather(*[self.tasks[path] for _, path in keys])))
+        for (description, path), context in parsed.items():
+            # A path shared by contexts with different descriptions is parsed once
+            if context.description != description:
+                parsed[(description, path)] = context = copy.copy(context)
+                context.description = description
+        result = Contexts.__new__(Contexts)
+        result.contexts = [parsed[key] for key in keys]
+        return result
+
+    async def close(self):
+        # Cancels the parses nothing waited for (e.g. of postings that failed), retrieving their errors
+        for task in self.tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.tasks.values(), return_exceptions = True)
+
+# Parsers by ftype. Each backend imports its library on first use, so e.g. a txt-only run never loads pypdf or docx.
+PARSERS = {}
+
+def register_parser(*ftypes):
+    def decorator(parser):
+        for ftype in ftypes:
+            PARSERS[ftype] = parser
+        return parser
+    return decorator
+
 class ContextParser:
     def __init__(self, ftype):
-        supported_ftypes = ["txt", "pdf", "docx", "https"]
-        if ftype in supported_ftypes:
-            self.parser = eval("self.{}_parser".format(ftype))
-        else:
-            self.parser = self.txt_parser
+        # Unknown file types are read as text
+        self.parser = PARSERS.get(ftype, PARSERS["txt"])
 
     def parse(self, fname):
         return self.parser(fname)
 
-    def https_parser(self, fname):
-        try: 
-            urls = [fname]
-            loader = AsyncHtmlLoader(urls)
-            docs = loader.load()
-            h2t = Html2TextTransformer()
-            docs_transformed = h2t.transform_documents(docs)
-            content = docs_transformed[0].page_content
-        except Exception as inst:
-            print(f"Error Parsing: {inst}\nRetrying") 
-            with requests.Session() as s:
-                response = s.get(fname)
-            h = html2text.HTML2Text()
-            content = h.handle(str(response.content))
-        return content
-    def docx_parser(self, fname):
-        doc = docx.Document(fname)
-        return "\n".join([par.text for par in doc.paragraphs])
-
-    def txt_parser(self, fname):
-        with open(fname, 'r') as f:
-            return "\n".join(f.readlines())
-
-    def pdf_parser(self, fname):
-        reader = PdfReader(fname)
-        return "\n".join([page.extract_text() for page in reader.pages])
+@register_parser("txt")
+def parse_txt(fname):
+    with open(fname, 'r') as f:
+        return "\n".join(f.readlines())
+
+@register_parser("https")
+def parse_https(fname):
+    from fetcher import get_fetcher
+    return get_fetcher().fetch_text(fname)
+
+@register_parser("pdf")
+def parse_pdf(fname):
+    return "\n".join(extract_pdf_pages(fname))
+
+@register_parser("docx")
+def parse_docx(fname):
+    return extract_docx(fname)
+
+# NOTE: the extractors are module-level functions so that they can be sent to a process pool
+def extract_pdf_pages(fname, start = 0, stop = None):
+    from pypdf import PdfReader
+    reader = PdfReader(fname)
+    return [page.extract_text() for page in reader.pages[start:stop]]
+
+def count_pdf_pages(fname):
+    from pypdf import PdfReader
+    return len(PdfReader(fname).pages)
+
+def extract_docx(fname):
+    import docx
+    doc = docx.Document(fname)
+    return "\n".join([par.text for par in doc.paragraphs])
+
+# `pypdf` and `python-docx` are CPU-bound pure Python, so threads serialize on the GIL. The ParseEngine sends PDF and
+# DOCX files to a process pool, sharding large PDFs into runs of `pages_per_shard` pages, and parses everything else
+# (I/O-bound text files and URLs) on threads.
+class ParseEngine:
+    process_ftypes = ["pdf", "docx"]
+
+    def __init__(self, max_workers = None, pages_per_shard = 8):
+        self.max_workers = max_workers
+        self.pages_per_shard = pages_per_shard
+        self.__processes = None
+        self.__lock = threading.Lock()
+
+    @property
+    def processes(self):
+        # Workers are only started once a file actually needs them. They are started from a fork server rather than
+        # forked from this process, which has other threads running (parses, fetches, the run log) whose locks a
+        # forked child would inherit in whatever state they were in.
+        # The fork server imports the parsers and their backends once, so that workers fork from it warm.
+        with self.__lock:
+            if self.__processes == None:
+                mp_context = multiprocessing.get_context("forkserver")
+                mp_context.set_forkserver_preload(["contexts", "pypdf", "docx"])
+                self.__processes = concurrent.futures.ProcessPoolExecutor(max_workers = self.max_workers, mp_context = mp_context)
+            return self.__processes
+
+    def parse(self, ftype, fname):
+        if ftype not in self.process_ftypes:
+            return ContextParser(ftype).parse(fname)
+        processes = self.processes
+        if ftype == "docx":
+            return processes.submit(extract_docx, fname).result()
+
+        npages = count_pdf_pages(fname)
+        shards = [
+            processes.submit(extract_pdf_pages, fname, start, min(start + self.pages_per_shard, npages))
+            for start in range(0, npages, self.pages_per_shard)
+        ]
+        # Collect the shards in page order as they finish
+        return "\n".join(text for shard in shards for text in shard.result())
+
+    def close(self):
+        if self.__processes != None:
+            self.__processes.shutdown()
+            self.__processes = None
 
 class Context:
     # We can brainstorm this as necessary
     def __str__(self):
         return "Context(description: {}, path: {}, ftype: {}, content: {})".format(self.description, self.path, self.ftype, self.content)
 
-    def __init__(self, description, path):
-        supported_ftypes = ["txt", "pdf", "docx"]
-
+    def __init__(self, description, path, cache = None, engine = None):
         self.description = description
         self.path = path
 
@@ -103,7 +212,7 @@ class Context:
         if http_search != None:
             self.ftype = "https"
         elif ftype != '': 
-            if ftype[1:] in supported_ftypes:
+            if ftype[1:] in PARSERS and ftype[1:] != "https":
                 self.ftype = ftype[1:]
             else:
                 self.ftype = None
@@ -111,7 +220,20 @@ class Context:
             self.ftype = None
 
 
-        self.content = ContextParser(self.ftype).parse(self.path)
+        if engine != None:
+            parse = functools.partial(engine.parse, self.ftype)
+        else:
+            parse = ContextParser(self.ftype).parse
+        parsed = []
+        def timed_parse(path):
+            parsed.append(True)
+            return parse(path)
+        start = time.perf_counter()
+        if cache is None:
+            self.content = timed_parse(self.path)
+        else:
+            self.content = cache.get_or_parse(self.ftype, self.path, timed_parse)
+        record_parse(self.ftype, time.perf_counter() - start, cached = len(parsed) == 0)
 
     def to_dict(self):
         return {
@@ -0,0 +1,45 @@
+import hashlib
+import json
+import os
+
+from parsecache import ParseCache, CACHE_ROOT
+
+DEFAULT_STORE_DIR = os.path.join(CACHE_ROOT, "preprocessed")
+
+# Persistent store of preprocessed contexts, so that re-runs only preprocess new or changed sources. Preprocessing
+# merges and renames contexts across a whole group, so a group of input contexts maps to its processed contexts. The
+# key covers the content and description of every input, the model, the prompt version and the preprocessing settings.
+class ContextStore:
+    def __init__(self, root = DEFAULT_STORE_DIR, max_bytes = 256 * 1024 * 1024):
+        self.store = ParseCache(root = root, max_bytes = max_bytes)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(contexts, model_name, prompt_version, settings = None):
+        payload = {
+            "contexts": sorted(
+                (context["description"], hashlib.sha256((context["content"] or "").encode()).hexdigest()) for context in contexts
+            ),
+            "model": model_name,
+            "prompt_version": prompt_version,
+            "settings": settings
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys = True, default = str).encode()).hexdigest()
+
+    def get(self, key):
+        entry = self.store.get(key)
+        if entry == None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(entry)
+
+    def put(self, key, contexts):
+        self.store.put(key, json.dumps(contexts))
+
+    def clear(self):
+        self.store.clear()
+
+    def __str__(self):
+        return "ContextStore(hits: {}, misses: {})".format(self.hits, self.misses)
@@ -0,0 +1,68 @@
+import asyncio
+import json
+import os
+from rich import print
+
+from parsecache import CACHE_ROOT
+
+DEFAULT_SOCKET = os.path.join(CACHE_ROOT, "ihcl.sock")
+
+# A line-delimited JSON protocol over a unix socket. A client sends one job per connection and the server streams
+# events back for it, ending with a "done" or "error" event. The server keeps whatever `handle_job` closes over (the
+# compiled graphs, model client and caches) warm between jobs.
+
+async def serve(path, handle_job):
+    # `handle_job(job, send)` runs a job, reporting progress with `send(event)`
+    async def handle(reader, writer):
+        def send(event):
+            writer.write((json.dumps(event) + "\n").encode())
+
+        try:
+            job = json.loads(await reader.readline())
+            print(f"[bold]Job[/bold]: {job}")
+            await handle_job(job, send)
+        except Exception as inst:
+            send({"event": "error", "message": repr(inst)})
+        finally:
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+            writer.close()
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok = True)
+    if os.path.exists(path):
+        # Only a socket left behind by a server that is gone is replaced; a live server keeps its socket
+        try:
+            _, writer = await asyncio.open_unix_connection(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            if os.path.exists(path):
+                os.remove(path)
+        else:
+            writer.close()
+            raise RuntimeError(f"An ihcl server is already listening on {path}")
+    server = await asyncio.start_unix_server(handle, path = path)
+    print(f"[bold]Serving[/bold] on {path}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+async def asubmit(path, job, on_event):
+    reader, writer = await asyncio.open_unix_connection(path)
+    try:
+        writer.write((json.dumps(job) + "\n").encode())
+        await writer.drain()
+        last = None
+        while line := await reader.readline():
+            last = json.loads(line)
+            on_event(last)
+        return last
+    finally:
+        writer.close()
+
+def submit(path, job, on_event):
+    # Returns the final event of the job
+    return asyncio.run(asubmit(path, job, on_event))
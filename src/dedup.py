@@ -0,0 +1,159 @@
+import hashlib
+import re
+import numpy as np
+from rich import print
+
+from serialize import normalize
+from tokens import count_tokens
+
+MERSENNE = (1 << 31) - 1
+
+def shingles(text, k = 5):
+    # Word k-grams of the lowercased text; texts shorter than k words are a single shingle
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= k:
+        return {" ".join(words)} if len(words) > 0 else set()
+    return {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+
+# MinHash signatures, so that the Jaccard similarity of two shingle sets is estimated by the fraction of equal slots
+class MinHasher:
+    def __init__(self, num_perm = 128, seed = 1, block = 4096):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, MERSENNE, num_perm, dtype = np.uint64)
+        self.b = rng.integers(0, MERSENNE, num_perm, dtype = np.uint64)
+        self.block = block
+
+    def signature(self, shingles):
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size = 8).digest(), "little") % MERSENNE for shingle in shingles),
+            dtype = np.uint64, count = len(shingles)
+        )
+        signature = np.full(len(self.a), MERSENNE, dtype = np.uint64)
+        # In blocks, so a long document never materializes a (shingles x num_perm) matrix
+        for start in range(0, len(hashes), self.block):
+            permuted = (np.outer(hashes[start:start + self.block], self.a) + self.b) % MERSENNE
+            signature = np.minimum(signature, permuted.min(axis = 0))
+        return signature
+
+def similarity(a, b):
+    return float((a == b).mean())
+
+# Locality-sensitive index of signatures: two signatures sharing any band of `rows` slots are candidate duplicates,
+# which are then confirmed on their estimated similarity
+class MinHashIndex:
+    def __init__(self, num_perm = 128, rows = 4):
+        self.rows = rows
+        self.bands = num_perm // rows
+        self.buckets = {}
+        self.signatures = []
+
+    def band_keys(self, signature):
+        return [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+    def query(self, signature, threshold):
+        # The most similar indexed item at or above `threshold`, as (id, similarity), else None
+        candidates = set()
+        for key in self.band_keys(signature):
+            candidates.update(self.buckets.get(key, ()))
+        best = None
+        for iid in candidates:
+            score = similarity(signature, self.signatures[iid])
+            if score >= threshold and (best == None or score > best[1]):
+                best = (iid, score)
+        return best
+
+    def add(self, signature):
+        iid = len(self.signatures)
+        self.signatures.append(signature)
+        for key in self.band_keys(signature):
+            self.buckets.setdefault(key, []).append(iid)
+        return iid
+
+# Drops near-duplicate contexts (e.g. several versions of a resume, or a posting's URL and a saved PDF of it) and
+# near-duplicate paragraphs across contexts before they are preprocessed, so that redundant tokens never reach the
+# model. The first copy in input order is kept. Paragraphs shorter than `min_words` (headings, dates) are always kept.
+class Deduplicator:
+    def __init__(self, threshold = 0.85, shingle_words = 5, min_words = 8, num_perm = 128):
+        assert 0 < threshold <= 1, ValueError("`threshold` must be in (0, 1]")
+        self.threshold = threshold
+        self.shingle_words = shingle_words
+        self.min_words = min_words
+        self.num_perm = num_perm
+        self.hasher = MinHasher(num_perm = num_perm)
+        self.removed_contexts = 0
+        self.removed_paragraphs = 0
+        self.tokens_saved = 0
+
+    def signature(self, text):
+        return self.hasher.signature(sorted(shingles(text, self.shingle_words)))
+
+    def paragraphs(self, content):
+        return [paragraph for paragraph in normalize(content).split("\n\n") if paragraph != ""]
+
+    def long_enough(self, paragraph):
+        return len(re.findall(r"\w+", paragraph)) >= self.min_words
+
+    def dedup(self, contexts, reference = ()):
+        # `contexts` and `reference` are {"description", "content"} dicts. Returns the contexts without the ones (and
+        # the paragraphs) that nearly duplicate an earlier context or one of `reference`, which are themselves kept,
+        # and a record of every removal.
+        documents = MinHashIndex(self.num_perm)
+        paragraphs = MinHashIndex(self.num_perm)
+        descriptions = []
+
+        def index(context):
+            descriptions.append(context["description"])
+            documents.add(self.signature(context["content"]))
+            for paragraph in self.paragraphs(context["content"]):
+                if self.long_enough(paragraph):
+                    paragraphs.add(self.signature(paragraph))
+
+        for context in reference:
+            if context.get("content"):
+                index(context)
+
+        kept = []
+        removals = []
+        for context in contexts:
+            content = context.get("content")
+            if not content:
+                kept.append(context)
+                continue
+            match = documents.query(self.signature(content), self.threshold)
+            if match != None:
+                print(f"\t-> dropped near-duplicate Context: {context['description']} ({match[1]:.0%} similar to {descriptions[match[0]]})")
+                tokens = count_tokens(content)
+                removals.append({"description": context["description"], "similar_to": descriptions[match[0]], "similarity": match[1], "paragraphs": None, "tokens": tokens})
+                self.removed_contexts += 1
+                self.tokens_saved += tokens
+                continue
+
+            remaining = []
+            removed = []
+            for paragraph in self.paragraphs(content):
+                if self.long_enough(paragraph):
+                    signature = self.signature(paragraph)
+                    match = paragraphs.query(signature, self.threshold)
+                    if match != None:
+                        removed.append((paragraph, match[1]))
+                        continue
+                    # Repeats within the same context are dropped too
+                    paragraphs.add(signature)
+                remaining.append(paragraph)
+            if len(removed) > 0:
+                print(f"\t-> dropped {len(removed)} near-duplicate paragraphs from Context: {context['description']}")
+                tokens = sum(count_tokens(paragraph) for paragraph, _ in removed)
+                removals.append({"description": context["description"], "similar_to": None, "similarity": min(sim for _, sim in removed), "paragraphs": len(removed), "tokens": tokens})
+                self.removed_paragraphs += len(removed)
+                self.tokens_saved += tokens
+                context = context | {"content": "\n\n".join(remaining)}
+
+            descriptions.append(context["description"])
+            documents.add(self.signature(content))
+            kept.append(context)
+        return kept, removals
+
+    def __str__(self):
+        return "Deduplicator(threshold: {}, removed contexts: {}, removed paragraphs: {}, ~{} tokens saved)".format(
+            self.threshold, self.removed_contexts, self.removed_paragraphs, self.tokens_saved
+        )
@@ -0,0 +1,190 @@
+import asyncio
+import functools
+import hashlib
+import json
+import os
+import time
+import uuid
+from rich import print
+
+from contexts import Ingestion, ParseEngine
+from parsecache import MemoryParseCache
+from preprocess import Preprocess
+from contextify import Contextifier
+from scheduler import ScheduledChatModel
+from profiling import ProfiledChatModel, add_queue_wait
+from runlog import current_run
+
+def fingerprint(contexts):
+    # Identifies a set of contexts by their descriptions and paths, plus the size and mtime of local files
+    items = []
+    for context in contexts:
+        item = [context['description'], context['path']]
+        if os.path.exists(context['path']):
+            stat = os.stat(context['path'])
+            item += [stat.st_size, stat.st_mtime_ns]
+        items.append(item)
+    return items
+
+# Wraps a chat model so that every `ainvoke` holds `semaphore`, capping the in-flight LLM calls of the whole run
+class BoundedChatModel:
+    def __init__(self, model, semaphore):
+        self.model = model
+        self.semaphore = semaphore
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def with_structured_output(self, schema, **kwargs):
+        return BoundedRunnable(self.model.with_structured_output(schema, **kwargs), self.semaphore)
+
+class BoundedRunnable:
+    def __init__(self, runnable, semaphore):
+        self.runnable = runnable
+        self.semaphore = semaphore
+
+    def invoke(self, *args, **kwargs):
+        return self.runnable.invoke(*args, **kwargs)
+
+    async def ainvoke(self, *args, **kwargs):
+        start = time.perf_counter()
+        async with self.semaphore:
+            add_queue_wait(time.perf_counter() - start)
+            return await self.runnable.ainvoke(*args, **kwargs)
+
+# Runs a whole `contextify` batch on one event loop. A single semaphore caps the number of in-flight LLM calls across
+# every posting, replacing the nested thread pools, and another the number of context fetches/parses so that parsing
+# later postings never holds up the LLM calls of earlier ones.
+class Engine:
+    def __init__(self, model, concurrency = 16, cache = None, run_log = None, wrap = None, scheduler = None, chunk_tokens = 2000, top_k = None, parse_workers = None, checkpointer = None, preprocess_profile = "thorough", store = None, noutputs = 3, parallel_candidates = False, first = None, dedup = None, parse_concurrency = None):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.parse_semaphore = asyncio.Semaphore(parse_concurrency if parse_concurrency != None else concurrency)
+        # A router takes its per-model caps before the global one, so it bounds its own models
+        bounded = getattr(model, "bounded", None)
+        self.model = bounded(self.semaphore) if bounded != None else BoundedChatModel(model, self.semaphore)
+        # Calls wait for rate limit budget before they take a slot in the semaphore
+        self.scheduler = scheduler
+        if scheduler != None:
+            self.model = ScheduledChatModel(self.model, scheduler)
+        # Records per-call latency, queue wait, token usage and cost while a profiler is set
+        self.model = ProfiledChatModel(self.model)
+        # `wrap` layers model wrappers (e.g. the LLM response cache) outside of the semaphore
+        if wrap != None:
+            self.model = wrap(self.model)
+        # Parsed contents stay in memory for the engine's lifetime, in front of the on-disk `cache`
+        self.cache = MemoryParseCache(cache)
+        self.parse_engine = ParseEngine(max_workers = parse_workers)
+        # Drops near-duplicate contexts and paragraphs (a `dedup.Deduplicator`) between parsing and preprocessing
+        self.dedup = dedup
+        # Structured events of the run (a `runlog.RunLog`), closed with the engine
+        self.run_log = run_log
+        # With a checkpointer every graph is checkpointed after each node so interrupted runs can be resumed
+        self.checkpointer = checkpointer
+        self.preprocess = Preprocess(self.model, run_log = run_log, chunk_tokens = chunk_tokens, checkpointer = checkpointer, profile = preprocess_profile, store = store)
+        self.contextifier = Contextifier(self.model, run_log = run_log, preprocess = self.preprocess, top_k = top_k, checkpointer = checkpointer,
+                                         noutputs = noutputs, parallel = parallel_candidates, first = first)
+
+    def ingestion(self):
+        return Ingestion(cache = self.cache, semaphore = self.parse_semaphore, engine = self.parse_engine)
+
+    async def parse(self, contexts):
+        return await self.ingestion().contexts(contexts)
+
+    def thread_id(self, kind, *parts):
+        if self.checkpointer == None:
+            return None
+        # Runs with different preprocess profiles have different graphs (and different dedup thresholds different
+        # inputs), so they never share checkpoints
+        parts = (self.preprocess.profile, self.dedup.threshold if self.dedup != None else None) + parts
+        return "{}-{}".format(kind, hashlib.sha256(json.dumps(parts, default = str).encode()).hexdigest()[:16])
+
+    async def checkpointed(self, thread_id):
+        if thread_id == None:
+            return False
+        snapshot = await self.contextifier.graph.aget_state({"configurable": {"thread_id": thread_id}})
+        return bool(snapshot.values)
+
+    def deduplicate(self, contexts, reference = (), pid = None):
+        contexts = [context.to_dict() for context in contexts]
+        if self.dedup == None:
+            return contexts
+        kept, removals = self.dedup.dedup(contexts, reference = reference)
+        if len(removals) > 0:
+            self.log("deduplicated", pid = pid, removals = removals, tokens_saved = sum(removal["tokens"] for removal in removals))
+        return kept
+
+    async def preprocess_contexts(self, contexts, thread_id = None):
+        if len(contexts) == 0:
+            return []
+        to_process = [context | {"metadata": {"processed": False}} for context in self.deduplicate(contexts)]
+        result = await self.preprocess.ainvoke(to_process, thread_id = thread_id)
+        return result["contexts"]
+
+    async def contextify(self, contexts, template, thread_id = None, on_candidate = None, index = None):
+        state = {
+            "contexts": contexts,
+            "template": template,
+            "output": None
+        }
+        result = await self.contextifier.ainvoke(state, thread_id = thread_id, on_candidate = on_candidate, index = index)
+        return result["output"].filled_templates
+
+    async def run(self, fixed_contexts, variable_contexts, template, on_result = None, on_candidate = None):
+        # `on_candidate(pid, i, filled_template)` streams filled templates as they finish, `on_result(pid, response)`
+        # reports every finished posting
+        current_run.set(uuid.uuid4().hex[:12])
+        self.log("run", fixed_contexts = len(fixed_contexts), postings = len(variable_contexts))
+        # Every unique path of the run is parsed once, in the background, and each posting starts as soon as its own
+        # contexts are parsed; parsing of later postings overlaps with preprocessing and LLM calls of earlier ones
+        ingestion = self.ingestion()
+        ingestion.submit(fixed_contexts)
+
+        async def prepare_fixed_contexts():
+            # Parse and preprocess the fixed contexts once; every variable context reuses the processed result
+            parsed_fixed_contexts = await ingestion.contexts(fixed_contexts)
+            fixed_thread_id = self.thread_id("fixed", fingerprint(fixed_contexts))
+            processed_fixed_contexts = await self.preprocess_contexts(parsed_fixed_contexts.contexts, thread_id = fixed_thread_id)
+            # Postings are deduplicated against the fixed contexts as parsed, since preprocessing rewrites them, and
+            # retrieval indexes the processed fixed contexts once for every posting
+            index = await asyncio.to_thread(self.contextifier.relevance_index, processed_fixed_contexts)
+            return [context.to_dict() for context in parsed_fixed_contexts.contexts], processed_fixed_contexts, index
+
+        fixed = asyncio.ensure_future(prepare_fixed_contexts())
+
+        async def run_contextifier(pid, contexts):
+            start = time.perf_counter()
+            thread_id = self.thread_id("posting", fingerprint(fixed_contexts), fingerprint(contexts), template)
+            posting_on_candidate = functools.partial(on_candidate, pid) if on_candidate != None else None
+            if await self.checkpointed(thread_id):
+                # Finished postings return their checkpointed output and partial ones resume, neither is re-parsed
+                print(f"[bold]Resuming posting {pid}[/bold]")
+                response = await self.contextify(None, template, thread_id = thread_id, on_candidate = posting_on_candidate)
+            else:
+                parsed_contexts = await ingestion.contexts(contexts)
+                fixed_reference, processed_fixed_contexts, index = await fixed
+                to_process = [context | {"metadata": {"processed": False}} for context in self.deduplicate(parsed_contexts.contexts, reference = fixed_reference, pid = pid)]
+                response = await self.contextify(processed_fixed_contexts + to_process, template, thread_id = thread_id, on_candidate = posting_on_candidate, index = index)
+            self.log("posting", pid = pid, wall = time.perf_counter() - start, outputs = len(response), chars = sum(len(txt) for txt in response))
+            if on_result != None:
+                on_result(pid, response)
+            return response
+
+        try:
+            # A failed posting does not cancel the others; failures are returned in place of their response
+            responses = await asyncio.gather(*[run_contextifier(pid, contexts) for pid, contexts in enumerate(variable_contexts)], return_exceptions = True)
+            # ...but a failure of the fixed contexts fails the run
+            await fixed
+            return responses
+        finally:
+            fixed.cancel()
+            await asyncio.gather(fixed, return_exceptions = True)
+            await ingestion.close()
+
+    def log(self, event, **fields):
+        if self.run_log != None:
+            self.run_log.log(event, **fields)
+
+    def close(self):
+        self.parse_engine.close()
+        if self.run_log != None:
+            self.run_log.close()
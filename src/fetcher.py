@@ -0,0 +1,132 @@
+import asyncio
+import atexit
+import hashlib
+import json
+import os
+import threading
+from rich import print
+
+from parsecache import ParseCache, CACHE_ROOT
+
+DEFAULT_HTTP_CACHE_DIR = os.path.join(CACHE_ROOT, "http")
+
+def html_to_text(html):
+    import html2text
+    h = html2text.HTML2Text()
+    h.ignore_links = True
+    h.ignore_images = True
+    return h.handle(html)
+
+# On-disk HTTP cache of converted page text along with the ETag/Last-Modified validators needed to revalidate it
+class HttpCache:
+    def __init__(self, root = DEFAULT_HTTP_CACHE_DIR, max_bytes = 256 * 1024 * 1024):
+        self.store = ParseCache(root = root, max_bytes = max_bytes)
+
+    @staticmethod
+    def key(url):
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    def get(self, url):
+        entry = self.store.get(self.key(url))
+        return json.loads(entry) if entry != None else None
+
+    def put(self, url, etag, last_modified, text):
+        self.store.put(self.key(url), json.dumps({"etag": etag, "last_modified": last_modified, "text": text}))
+
+    def clear(self):
+        self.store.clear()
+
+# A connection-pooled HTTP fetcher shared by every URL context. It runs one aiohttp session on a background event loop
+# so that both coroutines and parser threads reuse its connections, caps connections overall and per host, and
+# revalidates cached pages with conditional GETs so unchanged pages cost a 304 instead of a download and conversion.
+class Fetcher:
+    def __init__(self, cache = None, limit = 32, limit_per_host = 4, timeout = 30):
+        self.cache = cache
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self.requests = 0
+        self.revalidated = 0
+        self.__session = None
+        self.__lock = threading.Lock()
+        self.__loop = None
+
+    @property
+    def loop(self):
+        with self.__lock:
+            if self.__loop == None:
+                self.__loop = asyncio.new_event_loop()
+                threading.Thread(target = self.__loop.run_forever, name = "ihcl-fetcher", daemon = True).start()
+            return self.__loop
+
+    async def session(self):
+        # Created lazily on the fetcher loop, which owns it
+        if self.__session == None:
+            import aiohttp
+            connector = aiohttp.TCPConnector(limit = self.limit, limit_per_host = self.limit_per_host)
+            self.__session = aiohttp.ClientSession(connector = connector, timeout = aiohttp.ClientTimeout(total = self.timeout))
+        return self.__session
+
+    async def __fetch(self, url):
+        entry = self.cache.get(url) if self.cache != None else None
+        headers = {}
+        if entry != None:
+            if entry["etag"] != None:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"] != None:
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        session = await self.session()
+        self.requests += 1
+        async with session.get(url, headers = headers) as response:
+            if response.status == 304 and entry != None:
+                self.revalidated += 1
+                print(f"\t-> not modified: {url}")
+                return entry["text"]
+            response.raise_for_status()
+            html = await response.text()
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+
+        text = await asyncio.to_thread(html_to_text, html)
+        if self.cache != None and (etag != None or last_modified != None):
+            self.cache.put(url, etag, last_modified, text)
+        return text
+
+    async def afetch_text(self, url):
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self.__fetch(url), self.loop))
+
+    def fetch_text(self, url):
+        return asyncio.run_coroutine_threadsafe(self.__fetch(url), self.loop).result()
+
+    async def __close(self):
+        if self.__session != None:
+            await self.__session.close()
+            self.__session = None
+
+    def close(self):
+        with self.__lock:
+            loop, self.__loop = self.__loop, None
+        if loop == None:
+            return
+        asyncio.run_coroutine_threadsafe(self.__close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+    def __str__(self):
+        return "Fetcher(requests: {}, revalidated: {})".format(self.requests, self.revalidated)
+
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+def get_fetcher():
+    with _fetcher_lock:
+        if _fetcher == None:
+            set_fetcher(Fetcher(cache = HttpCache()))
+        return _fetcher
+
+def set_fetcher(fetcher):
+    global _fetcher
+    if _fetcher != None and _fetcher is not fetcher:
+        _fetcher.close()
+    _fetcher = fetcher
+    atexit.register(fetcher.close)
@@ -2,9 +2,10 @@ from rich import print
 import typer
 from typing_extensions import Annotated
 from typing import Optional, Tuple, List
-from langchain_core.messages import AnyMessage, SystemMessage, HumanMessage, ToolMessage
 
-import concurrent.futures
+import asyncio
+import collections
+import re
 
 import os
 import sys
@@ -14,71 +15,332 @@ project_root = os.path.dirname(os.path.abspath(__file__))
 # Add the 'src' directory to the Python path
 src_dir = os.path.join(project_root, 'src')
 sys.path.append(src_dir)
-from contexts import Contexts, Context
-from preprocess import PreprocessAgentState, Preprocess
-from contextify import ContextifierAgentState, Contextifier
-from langchain_openai import ChatOpenAI
-from omegaconf import OmegaConf
+# NOTE: only light modules are imported up front so that `--help` and argument errors are fast. The LLM stack
+# (langchain, langgraph, the OpenAI client) is imported when an engine is built, and parser backends on first use.
+from contexts import Context
+from parsecache import ParseCache
+from fetcher import Fetcher, HttpCache, set_fetcher
+from scheduler import Scheduler
+from profiling import Profiler, set_profiler
+import daemon
 
-# TODO: eventually switch to an ollama model 
+# TODO: eventually switch to an ollama model (until then, `--models` can route nodes to a local OpenAI-compatible endpoint)
 
 app = typer.Typer()
 
+def load_contexts(contextf, fixedf = None, cwd = None):
+    # `contextf` is either a contextf yaml or a directory with one job posting per file, in which case the fixed
+    # contexts come from the `fixedf` yaml. Returns the fixed contexts, the variable contexts and a name for each.
+    # Relative context paths are resolved against `cwd` (e.g. the directory `ihcl submit` was run from), if given.
+    from omegaconf import OmegaConf
+
+    def resolve(contexts):
+        contexts = OmegaConf.to_container(contexts) if OmegaConf.is_config(contexts) else contexts
+        if cwd == None:
+            return contexts
+        return [context | {"path": context["path"] if re.match(r'^http(s?):', context["path"]) else os.path.join(cwd, context["path"])} for context in contexts]
+
+    if os.path.isdir(contextf):
+        fixed_contexts = resolve(OmegaConf.load(fixedf)['fixed_contexts']) if fixedf != None else []
+        fnames = sorted(f for f in os.listdir(contextf) if not f.startswith(".") and os.path.isfile(os.path.join(contextf, f)))
+        variable_contexts = [[{"description": "job posting", "path": os.path.join(contextf, f)}] for f in fnames]
+        return fixed_contexts, variable_contexts, [os.path.splitext(f)[0] for f in fnames]
+
+    assert os.path.splitext(contextf)[1] == ".yaml", ValueError("The contextf must be a .yaml file or a directory")
+    parsedf = OmegaConf.load(contextf)
+    fixed_contexts = resolve(parsedf['fixed_contexts'])
+    variable_contexts = [resolve(contexts) for contexts in parsedf['variable_contexts']]
+    return fixed_contexts, variable_contexts, [str(pid) for pid in range(len(variable_contexts))]
+
+def load_settings(contextf, fixedf = None):
+    # Run settings (e.g. `preprocess: fast`) can be set at the top level of the contextf yaml, or of the fixedf yaml
+    # when contextf is a directory
+    settingsf = fixedf if os.path.isdir(contextf) else contextf
+    if settingsf == None:
+        return {}
+    from omegaconf import OmegaConf
+    parsedf = OmegaConf.load(settingsf)
+    return {key: parsedf[key] for key in ["preprocess"] if key in parsedf}
+
+def write_output(name, i, txt, output_dir = "output"):
+    # Written atomically so an interrupted run never leaves a truncated output behind
+    fname = os.path.join(output_dir, "{}_filled_template_{}.txt".format(name, i))
+    with open(fname + ".tmp", "w") as f:
+        f.write(txt)
+    os.replace(fname + ".tmp", fname)
+
+def build_engine(logf = None, no_cache = False, no_llm_cache = False, no_store = False, clear_cache = False, concurrency = 16, rpm = None, tpm = None, max_retries = 6,
+                 chunk_tokens = 2000, top_k = None, parse_workers = None, checkpoint = None, preprocess = "thorough", models = None,
+                 candidates = 3, parallel_candidates = False, first = None, dedup_threshold = 0.85, log_content = "truncate", parse_concurrency = None):
+    # Sets up the caches, the URL fetcher, the rate limiter and the model client, shared by `contextify` and `serve`.
+    # Returns the engine, the fetcher and the LLM cache.
+    from omegaconf import OmegaConf
+    from langchain_openai import ChatOpenAI
+    from llmcache import LLMCache, CachedChatModel
+    from contextstore import ContextStore
+    from engine import Engine
+    from checkpoint import SqliteSaver
+    from preprocess import PROFILES
+
+    if preprocess not in PROFILES:
+        raise typer.BadParameter(f"must be one of {PROFILES}", param_hint = "--preprocess")
+    if candidates < 1:
+        raise typer.BadParameter("must be at least 1", param_hint = "--candidates")
+    if first != None:
+        if not parallel_candidates:
+            raise typer.BadParameter("only applies with --parallel-candidates", param_hint = "--first")
+        if not 1 <= first <= candidates:
+            raise typer.BadParameter(f"must be between 1 and --candidates ({candidates})", param_hint = "--first")
+
+    cache = None if no_cache else ParseCache()
+    llm_cache = None if no_llm_cache else LLMCache()
+    store = None if no_store else ContextStore()
+    if clear_cache:
+        ParseCache().clear()
+        HttpCache().clear()
+        LLMCache().clear()
+        ContextStore().clear()
+    fetcher = Fetcher(cache = None if no_cache else HttpCache())
+    set_fetcher(fetcher)
+
+    run_log = None
+    if logf != None:
+        from runlog import RunLog, CONTENT_MODES
+        if log_content not in CONTENT_MODES:
+            raise typer.BadParameter(f"must be one of {CONTENT_MODES}", param_hint = "--log-content")
+        run_log = RunLog(logf, content = log_content)
+
+    wrap = None
+    if llm_cache != None:
+        prompt_version = OmegaConf.load('src/prompts.yaml')['version']
+        wrap = lambda model: CachedChatModel(model, llm_cache, prompt_version = prompt_version)
+    # The scheduler owns retries, so the client's own retry loop is disabled
+    scheduler = Scheduler(rpm = rpm, tpm = tpm, max_retries = max_retries)
+    if models != None:
+        from router import load_router
+        model = load_router(OmegaConf.to_container(OmegaConf.load(models)), lambda **spec: ChatOpenAI(max_retries = 0, **spec))
+    else:
+        model = ChatOpenAI(model="gpt-4o-mini", max_retries = 0)
+    dedup = None
+    if dedup_threshold != None:
+        if not 0 < dedup_threshold <= 1:
+            raise typer.BadParameter("must be in (0, 1]", param_hint = "--dedup-threshold")
+        from dedup import Deduplicator
+        dedup = Deduplicator(threshold = dedup_threshold)
+    engine = Engine(model, concurrency = concurrency, cache = cache, run_log = run_log, wrap = wrap, scheduler = scheduler, chunk_tokens = chunk_tokens, top_k = top_k, parse_workers = parse_workers,
+                    checkpointer = SqliteSaver(checkpoint) if checkpoint != None else None, preprocess_profile = preprocess, store = store,
+                    noutputs = candidates, parallel_candidates = parallel_candidates, first = first, dedup = dedup, parse_concurrency = parse_concurrency)
+    return engine, fetcher, llm_cache
+
+def load_template(templatef, bracket, cache = None):
+    parsed_template = Context("template", templatef, cache = cache)
+
+    template_metadata = {
+        "to_substitute": [],
+        "brackets": tuple(bracket)
+    }
+
+    return {
+        "content": parsed_template.content,
+        "description": parsed_template.description,
+        "metadata": template_metadata
+    }
+
+async def run_job(engine, contextf, templatef, bracket, fixedf = None, output_dir = "output", on_output = None, on_candidate = None, cwd = None):
+    # Fills the template for every posting of `contextf`, writing each filled template as soon as it is generated and
+    # every output of a posting again once it finishes (which also covers postings resumed from a checkpoint).
+    # Returns the failed postings as (name, exception) pairs.
+    fixed_contexts, variable_contexts, names = load_contexts(contextf, fixedf, cwd)
+    template = await asyncio.to_thread(load_template, templatef, bracket, engine.cache)
+
+    def on_generated(pid, i, txt):
+        write_output(names[pid], i, txt, output_dir)
+        if on_candidate != None:
+            on_candidate(names[pid], i)
+
+    def on_result(pid, response):
+        for i, txt in enumerate(response):
+            write_output(names[pid], i, txt, output_dir)
+        if on_output != None:
+            on_output(names[pid], len(response))
+
+    os.makedirs(output_dir, exist_ok = True)
+    responses = await engine.run(fixed_contexts, variable_contexts, template, on_result = on_result, on_candidate = on_generated)
+    return [(names[pid], response) for pid, response in enumerate(responses) if isinstance(response, BaseException)]
+
+async def run_submitted_job(engine, job, send):
+    # Runs a job sent by `ihcl submit` on the server's engine and sends its events back
+    profile = load_settings(job["contextf"], job.get("fixedf")).get("preprocess", engine.preprocess.profile)
+    if profile != engine.preprocess.profile:
+        raise ValueError(f"The contextf asks for the `{profile}` preprocess profile but this server runs `{engine.preprocess.profile}`; "
+                         f"start `ihcl serve --preprocess {profile}` or use `ihcl contextify`")
+    failures = await run_job(engine, job["contextf"], job["templatef"], job["bracket"], job.get("fixedf"), job["output_dir"],
+                             on_output = lambda name, n: send({"event": "result", "name": name, "outputs": n}),
+                             on_candidate = lambda name, i: send({"event": "candidate", "name": name, "index": i}),
+                             cwd = job.get("cwd"))
+    for name, inst in failures:
+        send({"event": "failed", "name": name, "message": repr(inst)})
+    send({"event": "done", "failures": len(failures)})
+
+def print_stats(engine, fetcher, llm_cache):
+    if engine.scheduler != None:
+        print(f"[bold]Scheduler[/bold]: {engine.scheduler}")
+    print(f"[bold]Fetcher[/bold]: {fetcher}")
+    if engine.contextifier.top_k != None:
+        print(f"[bold]Retrieval[/bold]: saved ~{engine.contextifier.prompt_tokens_saved} prompt tokens")
+    if llm_cache != None:
+        print(f"[bold]LLM cache[/bold]: {llm_cache}")
+    if engine.run_log != None:
+        print(f"[bold]Run log[/bold]: {engine.run_log}")
+    if engine.dedup != None:
+        print(f"[bold]Dedup[/bold]: {engine.dedup}")
+    if engine.preprocess.store != None:
+        print(f"[bold]Preprocess store[/bold]: {engine.preprocess.store}")
+
 @app.command()
 def contextify(
-        contextf: Annotated[str, typer.Argument(help="The yaml file that contains ...")], # TODO: fill out description
+        contextf: Annotated[str, typer.Argument(help="The yaml file that contains the fixed and variable contexts, or a directory with one job posting per file")],
         templatef: Annotated[str, typer.Argument(help="The template file which contains fields surrounded by a bracket that will be filled based on context and the template")],
         bracket: Annotated[Tuple[str, str], typer.Argument(help="The pair of brackets which identify fields in the template that will be filled with context")],
         hitl: Annotated[bool, typer.Option("--hitl", "-h", help= "Option for human in the loop workflow")] = False,
-        logf: Annotated[str, typer.Option("--log", "-l", help= "Filename for log")] = None
+        logf: Annotated[str, typer.Option("--log", "-l", help= "Filename for a JSONL log of every node's events, rotated by size")] = None,
+        log_content: Annotated[str, typer.Option("--log-content", help= "How long strings such as context content are logged: 'truncate', 'hash' or 'full'")] = "truncate",
+        no_cache: Annotated[bool, typer.Option("--no-cache", help= "Bypass the on-disk caches of parsed contexts and fetched pages")] = False,
+        no_llm_cache: Annotated[bool, typer.Option("--no-llm-cache", help= "Bypass the on-disk cache of LLM responses")] = False,
+        no_store: Annotated[bool, typer.Option("--no-store", help= "Bypass the on-disk store of preprocessed contexts, preprocessing every context again")] = False,
+        clear_cache: Annotated[bool, typer.Option("--clear-cache", help= "Clear the on-disk caches of parsed contexts, fetched pages, LLM responses and preprocessed contexts before running")] = False,
+        concurrency: Annotated[int, typer.Option("--concurrency", "-c", help= "Maximum number of in-flight LLM calls for the whole run")] = 16,
+        rpm: Annotated[Optional[int], typer.Option("--rpm", help= "Requests per minute budget for the model provider")] = None,
+        tpm: Annotated[Optional[int], typer.Option("--tpm", help= "Tokens per minute budget for the model provider")] = None,
+        max_retries: Annotated[int, typer.Option("--max-retries", help= "Number of times a rate limited or timed out LLM call is retried")] = 6,
+        chunk_tokens: Annotated[int, typer.Option("--chunk-tokens", help= "Contexts longer than this many tokens are cleaned in parallel chunks")] = 2000,
+        top_k: Annotated[Optional[int], typer.Option("--top-k", "-k", help= "Only include the k most relevant context passages for each field of the template in prompts")] = None,
+        parse_workers: Annotated[Optional[int], typer.Option("--parse-workers", help= "Number of processes parsing PDF and DOCX contexts (defaults to the number of CPUs)")] = None,
+        parse_concurrency: Annotated[Optional[int], typer.Option("--parse-concurrency", help= "Maximum number of in-flight context fetches and parses for the whole run (defaults to --concurrency)")] = None,
+        fixedf: Annotated[Optional[str], typer.Option("--fixed", "-f", help= "A yaml file with the fixed contexts, used when contextf is a directory of job postings")] = None,
+        checkpoint: Annotated[Optional[str], typer.Option("--checkpoint", help= "SQLite file to checkpoint every graph in; re-running with the same file skips finished postings and resumes partial ones")] = None,
+        models: Annotated[Optional[str], typer.Option("--models", "-m", help= "A yaml routing config that maps graphs and nodes (e.g. `preprocess`, `contextifier.tagger`) to models or local OpenAI-compatible endpoints, with optional per-model concurrency")] = None,
+        preprocess: Annotated[Optional[str], typer.Option("--preprocess", help= "Preprocessing profile: 'thorough' cleans, categorizes and summarizes in three stages, 'fast' in one call per context (defaults to the contextf setting, else thorough)")] = None,
+        candidates: Annotated[int, typer.Option("--candidates", help= "Number of filled templates generated for every posting")] = 3,
+        parallel_candidates: Annotated[bool, typer.Option("--parallel-candidates", help= "Generate every filled template in its own concurrent call and write each one as soon as it is ready")] = False,
+        first: Annotated[Optional[int], typer.Option("--first", help= "With --parallel-candidates, keep the first N filled templates that are ready and cancel the rest")] = None,
+        dedup_threshold: Annotated[float, typer.Option("--dedup-threshold", help= "Contexts and paragraphs at least this similar (estimated Jaccard similarity of word shingles) to an earlier one are dropped before preprocessing")] = 0.85,
+        no_dedup: Annotated[bool, typer.Option("--no-dedup", help= "Send every parsed context to the model, even near-duplicates")] = False,
+        profile: Annotated[Optional[str], typer.Option("--profile", help= "Write a JSON report of per-node latency, queue wait, tokens, retries and cost to this file, and Prometheus metrics next to it")] = None
         # human-in-the-loop option
         # tools
     ):
 
-    assert os.path.splitext(contextf)[1] == ".yaml", ValueError("The contextf must be a .yaml file")
+    settings = load_settings(contextf, fixedf)
+    preprocess = preprocess if preprocess != None else settings.get("preprocess", "thorough")
 
-    # Retrieve user-provided contexts form contextf
-    parsedf = OmegaConf.load(contextf)
-    fixed_contexts = parsedf['fixed_contexts']
-    variable_contexts = parsedf['variable_contexts']
-    parsed_contexts_list = []
+    profiler = Profiler() if profile != None else None
+    set_profiler(profiler)
 
-    # Append each variable context to the fixed contexts and then create a contexts object
-    for contexts in variable_contexts:
-        parsed_contexts_list.append(Contexts(fixed_contexts + contexts))
+    engine, fetcher, llm_cache = build_engine(logf = logf, log_content = log_content, no_cache = no_cache, no_llm_cache = no_llm_cache, no_store = no_store, clear_cache = clear_cache, concurrency = concurrency, rpm = rpm, tpm = tpm,
+                                              max_retries = max_retries, chunk_tokens = chunk_tokens, top_k = top_k, parse_workers = parse_workers, parse_concurrency = parse_concurrency, checkpoint = checkpoint, preprocess = preprocess, models = models,
+                                              candidates = candidates, parallel_candidates = parallel_candidates, first = first,
+                                              dedup_threshold = dedup_threshold if not no_dedup else None)
+    ready = collections.Counter()
+    def on_candidate(name, i):
+        ready[name] += 1
+        print(f"\t-> posting {name}: filled template {i} ready ({ready[name]} of {first if first != None else candidates})")
+    try:
+        failures = asyncio.run(run_job(engine, contextf, templatef, bracket, fixedf, on_candidate = on_candidate))
+    finally:
+        engine.close()
+    for name, inst in failures:
+        print(f"[bold red]Posting {name} failed[/bold red]: {inst!r}")
 
-    parsed_template = Context("template", templatef)
+    print_stats(engine, fetcher, llm_cache)
+    if profiler != None:
+        profiler.export(profile)
+        for entry in profiler.summary():
+            print("[bold]Profile[/bold] {kind} {name}: {count} calls, p50 {wall_p50:.3f}s, p95 {wall_p95:.3f}s".format(**entry)
+                  + (", {:.0f} prompt + {:.0f} completion tokens, ${:.4f}".format(entry["prompt_tokens_total"], entry["completion_tokens_total"], entry["cost_total"]) if "cost_total" in entry else ""))
+    if len(failures) > 0:
+        raise typer.Exit(code = 1)
 
-    template_metadata = {
-        "to_substitute": [],
-        "brackets": bracket
-    }
+@app.command()
+def serve(
+        socket: Annotated[str, typer.Option("--socket", "-s", help= "Unix socket to listen on")] = daemon.DEFAULT_SOCKET,
+        logf: Annotated[str, typer.Option("--log", "-l", help= "Filename for a JSONL log of every node's events, rotated by size")] = None,
+        log_content: Annotated[str, typer.Option("--log-content", help= "How long strings such as context content are logged: 'truncate', 'hash' or 'full'")] = "truncate",
+        no_cache: Annotated[bool, typer.Option("--no-cache", help= "Bypass the on-disk caches of parsed contexts and fetched pages")] = False,
+        no_llm_cache: Annotated[bool, typer.Option("--no-llm-cache", help= "Bypass the on-disk cache of LLM responses")] = False,
+        no_store: Annotated[bool, typer.Option("--no-store", help= "Bypass the on-disk store of preprocessed contexts, preprocessing every context again")] = False,
+        concurrency: Annotated[int, typer.Option("--concurrency", "-c", help= "Maximum number of in-flight LLM calls across all jobs")] = 16,
+        rpm: Annotated[Optional[int], typer.Option("--rpm", help= "Requests per minute budget for the model provider")] = None,
+        tpm: Annotated[Optional[int], typer.Option("--tpm", help= "Tokens per minute budget for the model provider")] = None,
+        max_retries: Annotated[int, typer.Option("--max-retries", help= "Number of times a rate limited or timed out LLM call is retried")] = 6,
+        chunk_tokens: Annotated[int, typer.Option("--chunk-tokens", help= "Contexts longer than this many tokens are cleaned in parallel chunks")] = 2000,
+        top_k: Annotated[Optional[int], typer.Option("--top-k", "-k", help= "Only include the k most relevant context passages for each field of the template in prompts")] = None,
+        parse_workers: Annotated[Optional[int], typer.Option("--parse-workers", help= "Number of processes parsing PDF and DOCX contexts (defaults to the number of CPUs)")] = None,
+        parse_concurrency: Annotated[Optional[int], typer.Option("--parse-concurrency", help= "Maximum number of in-flight context fetches and parses for the whole run (defaults to --concurrency)")] = None,
+        checkpoint: Annotated[Optional[str], typer.Option("--checkpoint", help= "SQLite file to checkpoint every graph in")] = None,
+        models: Annotated[Optional[str], typer.Option("--models", "-m", help= "A yaml routing config that maps graphs and nodes (e.g. `preprocess`, `contextifier.tagger`) to models or local OpenAI-compatible endpoints, with optional per-model concurrency")] = None,
+        preprocess: Annotated[str, typer.Option("--preprocess", help= "Preprocessing profile used for every job: 'thorough' or 'fast' (jobs whose contextf sets another profile are rejected)")] = "thorough",
+        candidates: Annotated[int, typer.Option("--candidates", help= "Number of filled templates generated for every posting")] = 3,
+        parallel_candidates: Annotated[bool, typer.Option("--parallel-candidates", help= "Generate every filled template in its own concurrent call and write each one as soon as it is ready")] = False,
+        first: Annotated[Optional[int], typer.Option("--first", help= "With --parallel-candidates, keep the first N filled templates that are ready and cancel the rest")] = None,
+        dedup_threshold: Annotated[float, typer.Option("--dedup-threshold", help= "Contexts and paragraphs at least this similar (estimated Jaccard similarity of word shingles) to an earlier one are dropped before preprocessing")] = 0.85,
+        no_dedup: Annotated[bool, typer.Option("--no-dedup", help= "Send every parsed context to the model, even near-duplicates")] = False
+    ):
+    # Keeps one engine (compiled graphs, model client and caches) warm and runs the jobs sent by `ihcl submit` on it
+    engine, fetcher, llm_cache = build_engine(logf = logf, log_content = log_content, no_cache = no_cache, no_llm_cache = no_llm_cache, no_store = no_store, concurrency = concurrency, rpm = rpm, tpm = tpm, max_retries = max_retries,
+                                              chunk_tokens = chunk_tokens, top_k = top_k, parse_workers = parse_workers, parse_concurrency = parse_concurrency, checkpoint = checkpoint, preprocess = preprocess, models = models,
+                                              candidates = candidates, parallel_candidates = parallel_candidates, first = first,
+                                              dedup_threshold = dedup_threshold if not no_dedup else None)
 
-    template = {
-        "content": parsed_template.content,
-        "description": parsed_template.description,
-        "metadata": template_metadata
+    async def handle_job(job, send):
+        try:
+            await run_submitted_job(engine, job, send)
+        finally:
+            print_stats(engine, fetcher, llm_cache)
+
+    try:
+        asyncio.run(daemon.serve(socket, handle_job))
+    except KeyboardInterrupt:
+        pass
+    except RuntimeError as inst:
+        print(f"[bold red]Could not serve[/bold red]: {inst}")
+        raise typer.Exit(code = 1)
+    finally:
+        engine.close()
+
+@app.command()
+def submit(
+        contextf: Annotated[str, typer.Argument(help="The yaml file that contains the fixed and variable contexts, or a directory with one job posting per file")],
+        templatef: Annotated[str, typer.Argument(help="The template file which contains fields surrounded by a bracket that will be filled based on context and the template")],
+        bracket: Annotated[Tuple[str, str], typer.Argument(help="The pair of brackets which identify fields in the template that will be filled with context")],
+        fixedf: Annotated[Optional[str], typer.Option("--fixed", "-f", help= "A yaml file with the fixed contexts, used when contextf is a directory of job postings")] = None,
+        socket: Annotated[str, typer.Option("--socket", "-s", help= "Unix socket of a running `ihcl serve`")] = daemon.DEFAULT_SOCKET,
+        output_dir: Annotated[str, typer.Option("--output", "-o", help= "Directory the filled templates are written to")] = "output"
+    ):
+    # Paths are resolved here since the server runs in its own working directory, which is also why the paths listed
+    # in the contextf and fixedf are resolved against `cwd`
+    job = {
+        "contextf": os.path.abspath(contextf),
+        "templatef": os.path.abspath(templatef),
+        "bracket": list(bracket),
+        "fixedf": os.path.abspath(fixedf) if fixedf != None else None,
+        "output_dir": os.path.abspath(output_dir),
+        "cwd": os.getcwd()
     }
 
-    def run_contextifier(parsed_contexts):
-        contexts = [context.to_dict() | {"metadata": {"processed": False}} for context in parsed_contexts.contexts]    
-        state: ContextifierAgentState = {
-            "contexts": contexts,
-            "template": template,
-            "output": None
-        }
-        result = Contextifier(model, logf=logf).graph.invoke(state)
-        response = result["output"].filled_templates
-        return response
-
-    model = ChatOpenAI(model="gpt-4o-mini")
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        for pid, response in enumerate(executor.map(run_contextifier, parsed_contexts_list)):
-            for i, txt in enumerate(response):
-                with open("output/{}_filled_template_{}.txt".format(pid, i), "w") as f:
-                    f.write(txt)
-
-
-    
+    def on_event(event):
+        if event["event"] == "candidate":
+            print(f"\t-> posting {event['name']}: filled template {event['index']} ready")
+        elif event["event"] == "result":
+            print(f"[bold green]Posting {event['name']}[/bold green]: wrote {event['outputs']} filled templates")
+        elif event["event"] == "failed":
+            print(f"[bold red]Posting {event['name']} failed[/bold red]: {event['message']}")
+        elif event["event"] == "error":
+            print(f"[bold red]Job failed[/bold red]: {event['message']}")
+
+    last = daemon.submit(socket, job, on_event)
+    if last == None or last["event"] != "done" or last["failures"] > 0:
+        raise typer.Exit(code = 1)
+
 if __name__ == "__main__":
     app()
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pydantic import BaseModel
+from parsecache import CACHE_ROOT
+
+DEFAULT_CACHE_PATH = os.path.join(CACHE_ROOT, "llm.sqlite")
+
+# Persistent cache of structured LLM responses. Entries expire after `ttl` seconds and the least-recently-used
+# entries are evicted once there are more than `max_entries`.
+class LLMCache:
+    def __init__(self, path = DEFAULT_CACHE_PATH, ttl = 7 * 24 * 60 * 60, max_entries = 10000):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok = True)
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.__lock = threading.Lock()
+        self.__conn = sqlite3.connect(path, check_same_thread = False)
+        with self.__lock, self.__conn:
+            self.__conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self.__conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+
+    @staticmethod
+    def key(model_name, messages, schema, prompt_version):
+        payload = {
+            "model": model_name,
+            "messages": [(message.type, message.content) for message in messages],
+            "schema": schema.model_json_schema(),
+            "prompt_version": prompt_version
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys = True, default = str).encode()).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self.__lock, self.__conn:
+            row = self.__conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                self.__conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.__conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, value):
+        now = time.time()
+        with self.__lock, self.__conn:
+            self.__conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, value, now, now))
+            self.__conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def clear(self):
+        with self.__lock, self.__conn:
+            self.__conn.execute("DELETE FROM responses")
+
+    def __len__(self):
+        with self.__lock:
+            return self.__conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+    def __str__(self):
+        return "LLMCache(hits: {}, misses: {}, hit rate: {:.1%})".format(self.hits, self.misses, self.hit_rate())
+
+# Wraps a chat model so that `with_structured_output(...).invoke(messages)` is answered from an `LLMCache`
+class CachedChatModel:
+    def __init__(self, model, cache, prompt_version = None):
+        self.model = model
+        self.cache = cache
+        self.prompt_version = prompt_version
+
+    @property
+    def model_name(self):
+        return getattr(self.model, "model_name", type(self.model).__name__)
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def with_structured_output(self, schema, **kwargs):
+        runnable = self.model.with_structured_output(schema, **kwargs)
+        # Only pydantic schemas without raw output can be round-tripped through the cache
+        if not (isinstance(schema, type) and issubclass(schema, BaseModel)) or kwargs.get("include_raw", False):
+            return runnable
+        return CachedStructuredOutput(self, runnable, schema)
+
+class CachedStructuredOutput:
+    def __init__(self, cached_model, runnable, schema):
+        self.cached_model = cached_model
+        self.runnable = runnable
+        self.schema = schema
+
+    def key(self, messages):
+        return LLMCache.key(self.cached_model.model_name, messages, self.schema, self.cached_model.prompt_version)
+
+    def invoke(self, messages, *args, **kwargs):
+        key = self.key(messages)
+        value = self.cached_model.cache.get(key)
+        if value is not None:
+            return self.schema.model_validate_json(value)
+        response = self.runnable.invoke(messages, *args, **kwargs)
+        if response is not None:
+            self.cached_model.cache.put(key, response.model_dump_json())
+        return response
+
+    async def ainvoke(self, messages, *args, **kwargs):
+        key = self.key(messages)
+        value = self.cached_model.cache.get(key)
+        if value is not None:
+            return self.schema.model_validate_json(value)
+        response = await self.runnable.ainvoke(messages, *args, **kwargs)
+        if response is not None:
+            self.cached_model.cache.put(key, response.model_dump_json())
+        return response
@@ -0,0 +1,142 @@
+import collections
+import hashlib
+import os
+import tempfile
+import threading
+from rich import print
+
+# NOTE: bump this whenever a registered parser (`contexts.PARSERS`) changes its output so stale entries are never served
+PARSER_VERSION = 1
+
+CACHE_ROOT = os.environ.get("IHCL_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "ihcl"))
+DEFAULT_CACHE_DIR = os.path.join(CACHE_ROOT, "parse")
+
+# On-disk cache of parsed `Context` content, keyed on the hash of the file's bytes, its ftype and `PARSER_VERSION`.
+# Entries are evicted least-recently-used first once the cache grows beyond `max_bytes`.
+class ParseCache:
+    def __init__(self, root = DEFAULT_CACHE_DIR, max_bytes = 256 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok = True)
+
+    def key(self, ftype, path):
+        # URLs are revalidated by the fetcher's own HTTP cache, so they are never cached here
+        if ftype == "https":
+            return None
+        h = hashlib.sha256()
+        h.update(f"{PARSER_VERSION}:{ftype}:".encode())
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        return h.hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.root, f"{key}.txt")
+
+    def get(self, key):
+        fname = self.entry_path(key)
+        try:
+            with open(fname, "r") as f:
+                content = f.read()
+        except FileNotFoundError:
+            return None
+        # Refresh the mtime so that eviction is least-recently-used rather than oldest-written
+        try:
+            os.utime(fname)
+        except FileNotFoundError:
+            pass
+        return content
+
+    def put(self, key, content):
+        fd, tmp = tempfile.mkstemp(dir = self.root, suffix = ".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+        os.replace(tmp, self.entry_path(key))
+        self.evict()
+
+    def get_or_parse(self, ftype, path, parse):
+        key = self.key(ftype, path)
+        if key is not None:
+            content = self.get(key)
+            if content is not None:
+                print(f"\t-> parse cache hit: {path}")
+                return content
+        content = parse(path)
+        if key is not None and content is not None:
+            self.put(key, content)
+        return content
+
+    def entries(self):
+        entries = []
+        for entry in os.scandir(self.root):
+            if not entry.name.endswith(".txt"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, fname in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(fname)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        for _, _, fname in self.entries():
+            try:
+                os.remove(fname)
+            except FileNotFoundError:
+                pass
+
+# Parsed content kept in memory in front of an optional on-disk `cache`, keyed on the path, size and mtime of local
+# files, so a long-running engine (e.g. under `ihcl serve`) never re-reads or re-hashes unchanged files between jobs.
+# At most `max_entries` contents are kept, least-recently-used first out.
+class MemoryParseCache:
+    def __init__(self, cache = None, max_entries = 1024):
+        self.cache = cache
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.__lock = threading.Lock()
+
+    def key(self, ftype, path):
+        # URLs are revalidated by the fetcher's own HTTP cache, so they are never cached here
+        if ftype == "https":
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (ftype, os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+    def get_or_parse(self, ftype, path, parse):
+        key = self.key(ftype, path)
+        if key is not None:
+            with self.__lock:
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                    return self.entries[key]
+        content = self.cache.get_or_parse(ftype, path, parse) if self.cache is not None else parse(path)
+        if key is not None and content is not None:
+            with self.__lock:
+                self.entries[key] = content
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last = False)
+        return content
+
+    def clear(self):
+        with self.__lock:
+            self.entries.clear()
+        if self.cache is not None:
+            self.cache.clear()
@@ -3,11 +3,17 @@ from rich import print
 from langgraph.graph import StateGraph, END
 from langchain_core.messages import AnyMessage, SystemMessage, HumanMessage, ToolMessage, AIMessage
 import operator
-import concurrent.futures
+import asyncio
 from omegaconf import OmegaConf
 
 from pydantic import BaseModel, Field
 
+from tokens import split_tokens
+from checkpoint import resume_or_invoke
+from profiling import profiled
+from runlog import describe_contexts
+from serialize import field, serialize_context, serialize_contexts, serialize_descriptions
+
 # Data Model
 class ContextMetadata(BaseModel):
     processed: bool = Field(description="Whether the Context was completely processed or not")
@@ -18,42 +24,62 @@ class Context(BaseModel):
     metadata: ContextMetadata = Field(description="Metadata about the context object")
 
 class PreprocessAgentState(BaseModel):
-    messages: Annotated[List[Union[HumanMessage,SystemMessage,AIMessage]], operator.add] = Field(description= "The history of messages")# messages: keeps track of history
+    messages: Annotated[List[Union[HumanMessage,SystemMessage,AIMessage]], operator.add] = Field(default_factory=list, description= "The history of messages")# messages: keeps track of history
     contexts: List[Context] = Field(description= "A list of Context objects")# descriptions: guidelines for acting on content
 
+# The "thorough" profile cleans, categorizes and summarizes in three stages; "fast" does all of it in one call per context
+PROFILES = ["thorough", "fast"]
+
 # Preprocess Graph
 # NOTE: potentially cache instantiations of this class
 class Preprocess:
-    def __init__(self, model, system=None, logf=None):
+    def __init__(self, model, system=None, run_log=None, chunk_tokens=2000, checkpointer=None, profile="thorough", store=None):
+        assert profile in PROFILES, ValueError(f"The preprocess profile must be one of {PROFILES}")
         graph = StateGraph(PreprocessAgentState)
 
-        graph.add_node("cleaner", self.cleaner)
-        graph.add_node("categorizer", self.categorizer)
-        graph.add_node("summarizer", self.summarizer)
-
-        graph.set_entry_point("cleaner")
-        graph.add_edge("cleaner", "categorizer")
-        graph.add_edge("categorizer", "summarizer")
-
-        # graph.add_conditional_edges(
-        #     "categorizer", 
-        #     valid_categories, 
-        #     {"categorizer": "categorizer", "summarizer": "summarizer"}
-        # )
-        graph.add_edge("summarizer", END)
-
-        self.graph = graph.compile()
-        self.__prompts = OmegaConf.load('src/prompts.yaml')['preprocessor']
+        if profile == "fast":
+            # One call per context (or per chunk of a long one) cleans, categorizes and summarizes it, without waiting on
+            # the other contexts
+            graph.add_node("processor", self.processor)
+            graph.set_entry_point("processor")
+            graph.add_edge("processor", END)
+        else:
+            graph.add_node("cleaner", self.cleaner)
+            graph.add_node("categorizer", self.categorizer)
+            graph.add_node("summarizer", self.summarizer)
+
+            graph.set_entry_point("cleaner")
+            graph.add_edge("cleaner", "categorizer")
+            graph.add_edge("categorizer", "summarizer")
+
+            # graph.add_conditional_edges(
+            #     "categorizer", 
+            #     valid_categories, 
+            #     {"categorizer": "categorizer", "summarizer": "summarizer"}
+            # )
+            graph.add_edge("summarizer", END)
+        self.profile = profile
+
+        self.graph = graph.compile(checkpointer=checkpointer)
+        prompts = OmegaConf.load('src/prompts.yaml')
+        self.__prompts = prompts['preprocessor']
+        self.prompt_version = prompts['version']
 
         # self.tools = {t.name: t for t in tools}
         self.model = model
-        self.logf = logf
+        # Structured events of every node go to `run_log` (a `runlog.RunLog`), if any
+        self.run_log = run_log
+        # Contexts with more content than this are cleaned (or processed, in the fast profile) in parallel chunks and
+        # merged back together
+        self.chunk_tokens = chunk_tokens
+        # With a store, groups of contexts that were already preprocessed are loaded instead of preprocessed again
+        self.store = store
 
     def valid_categories(self):
         pass
 
-    def summarizer(self, state: PreprocessAgentState, max_workers = 5):
-        # Eventually multithread this to operate per CleanedContext
+    @profiled("preprocess")
+    async def summarizer(self, state: PreprocessAgentState):
         print('Invoking [bold yellow]summarizer[/bold yellow]')
         SUMMARIZER_PROMPT = self.__prompts["components"]["summarizer"]["system_prompt"]
 
@@ -62,39 +88,35 @@ class Preprocess:
             grouped_cc.setdefault(context.description, [])
             grouped_cc[context.description].append(context)
         
-        def summarize_contexts(contexts):
-            messages = [SystemMessage(content=SUMMARIZER_PROMPT)] + [HumanMessage(content=f"{contexts}")]
-            return self.model.with_structured_output(Context).invoke(messages)
+        async def summarize_contexts(contexts):
+            messages = [SystemMessage(content=SUMMARIZER_PROMPT)] + [HumanMessage(content=serialize_contexts(contexts))]
+            return await self.model.with_structured_output(Context).ainvoke(messages)
 
-        summarized_contexts = []
-        with concurrent.futures.ThreadPoolExecutor(max_workers = max_workers) as executor:
-            for cc in executor.map(summarize_contexts, grouped_cc.values()):
-                summarized_contexts.append(cc)
+        summarized_contexts = list(await asyncio.gather(*[summarize_contexts(contexts) for contexts in grouped_cc.values()]))
 
         print('Done with [bold yellow]summarizer[/bold yellow]')
         for context in summarized_contexts:
             context.metadata.processed = True
 
-        self.append_to_log(f'summarizer: summarized content in Contexts.\n{summarized_contexts}"')
+        self.log("summarized", groups = len(grouped_cc), contexts = describe_contexts(summarized_contexts))
 
         return {
             'contexts': summarized_contexts
         }
 
-    def cleaner(self, state: PreprocessAgentState, max_workers = 5):
-        # Eventually multithread this to operate per CleanedContext
+    @profiled("preprocess")
+    async def cleaner(self, state: PreprocessAgentState):
         print('Invoking [bold red]cleaner[/bold red]')
         CLEANER_PROMPT = self.__prompts["components"]["cleaner"]["system_prompt"]
 
-        def clean_context(context):
-            messages = [SystemMessage(content=CLEANER_PROMPT)] + [HumanMessage(content=f"{context}")]
-            return self.model.with_structured_output(Context).invoke(messages)
+        async def clean_chunk(context):
+            messages = [SystemMessage(content=CLEANER_PROMPT)] + [HumanMessage(content=serialize_context(context))]
+            return await self.model.with_structured_output(Context).ainvoke(messages)
 
-        cleaned_contexts = []
-        with concurrent.futures.ThreadPoolExecutor(max_workers = max_workers) as executor:
-            for cc in executor.map(clean_context, state.contexts):
-                cleaned_contexts.append(cc)
+        async def clean_context(context):
+            return await self.in_chunks(context, clean_chunk, "cleaning")
 
+        cleaned_contexts = await asyncio.gather(*[clean_context(context) for context in state.contexts])
 
         cleaned_contexts = list(filter(lambda c: c.content != None, cleaned_contexts))
         print('Done with [bold red]cleaner[/bold red]')
@@ -102,12 +124,55 @@ class Preprocess:
         for context in cleaned_contexts:
             context.metadata.processed = False
 
-        self.append_to_log(f'cleaner: cleaned content in Contexts unrelated to description.\n{cleaned_contexts}"')
+        self.log("cleaned", inputs = describe_contexts(state.contexts), contexts = describe_contexts(cleaned_contexts))
         return {
             'contexts': cleaned_contexts
         }
 
-    def categorizer(self, state: PreprocessAgentState, categories = None):
+    async def in_chunks(self, context, process_chunk, verb, keep_description = True):
+        # Contexts with more than `chunk_tokens` tokens are processed in parallel chunks and merged back together
+        chunks = split_tokens(context.content or "", self.chunk_tokens, getattr(self.model, "model_name", None))
+        if len(chunks) == 1:
+            return await process_chunk(context)
+
+        print(f"\t-> {verb} {context.description} in {len(chunks)} chunks")
+        processed_chunks = await asyncio.gather(*[
+            process_chunk(Context(description=context.description, content=chunk, metadata=context.metadata.model_copy())) for chunk in chunks
+        ])
+        contents = [pc.content for pc in processed_chunks if pc.content != None]
+        return Context(
+            description=context.description if keep_description else processed_chunks[0].description,
+            content="\n\n".join(contents) if len(contents) > 0 else None,
+            metadata=context.metadata if keep_description else processed_chunks[0].metadata
+        )
+
+    @profiled("preprocess")
+    async def processor(self, state: PreprocessAgentState):
+        print('Invoking [bold magenta]processor[/bold magenta]')
+        PROCESSOR_PROMPT = self.__prompts["components"]["processor"]["system_prompt"]
+
+        async def process_chunk(context):
+            messages = [SystemMessage(content=PROCESSOR_PROMPT)] + [HumanMessage(content=serialize_context(context))]
+            return await self.model.with_structured_output(Context).ainvoke(messages)
+
+        async def process_context(context):
+            # The chunks of a context are categorized separately, so the merged context takes the first chunk's description
+            return await self.in_chunks(context, process_chunk, "processing", keep_description = False)
+
+        processed_contexts = await asyncio.gather(*[process_context(context) for context in state.contexts])
+
+        processed_contexts = list(filter(lambda c: c.content != None, processed_contexts))
+        print('Done with [bold magenta]processor[/bold magenta]')
+        for context in processed_contexts:
+            context.metadata.processed = True
+
+        self.log("processed", inputs = describe_contexts(state.contexts), contexts = describe_contexts(processed_contexts))
+        return {
+            'contexts': processed_contexts
+        }
+
+    @profiled("preprocess")
+    async def categorizer(self, state: PreprocessAgentState, categories = None):
         print('Invoking [bold blue]categorizer[/bold blue]')
         # You will potentially rename the descriptions in the provided list of CleanedContext object which contains a `Context` object with an associated `cleaned` boolean indicator. \
 
@@ -117,29 +182,54 @@ class Preprocess:
             descriptions: List[str] = Field(description= "A list of descriptions", min_length=len(state.contexts), max_length=len(state.contexts))
 
         descriptions = [context.description for context in state.contexts]
-        messages = [SystemMessage(content=CATEGORIZER_PROMPT)] + [HumanMessage(content=f"{descriptions}")]
-        response = self.model.with_structured_output(Descriptions).invoke(messages)
+        messages = [SystemMessage(content=CATEGORIZER_PROMPT)] + [HumanMessage(content=serialize_descriptions(descriptions))]
+        response = await self.model.with_structured_output(Descriptions).ainvoke(messages)
 
         for context, new_desc in zip(state.contexts, response.descriptions):
             context.description = new_desc
             
         print('Done with [bold blue]categorizer[/bold blue]')
-        self.append_to_log(f'categorizer: identified categories for Contexts\n{response}"')
+        self.log("categorized", descriptions = descriptions, categories = response.descriptions)
         return {
             'contexts': state.contexts
         }
 
-    def invoke(self, contexts: List[Context]):
+    def invoke(self, contexts: List[Context], thread_id=None):
+        return asyncio.run(self.ainvoke(contexts, thread_id))
+
+    async def ainvoke(self, contexts: List[Context], thread_id=None):
         content = "Preprocess the list of context objects."
         messages = [HumanMessage(content=content)]
         state: PreprocessAgentState = {
             "contexts": contexts
         }
-        self.append_to_log(f'system: {content}"')
-        return self.graph.invoke(state)
-
-    def append_to_log(self, text):
-        if self.logf == None:
-            return  
-        with open(self.logf, "a") as f:
-            f.write(text + "\n") 
+        self.log("preprocess", contexts = describe_contexts(contexts))
+
+        key = None
+        if self.store != None:
+            key = self.store.key(
+                [{"description": field(context, "description"), "content": field(context, "content")} for context in contexts],
+                self.model_id(), self.prompt_version, {"profile": self.profile, "chunk_tokens": self.chunk_tokens}
+            )
+            stored = self.store.get(key)
+            if stored != None:
+                print(f"\t-> preprocess store hit for {len(contexts)} contexts")
+                return {"contexts": [Context(**context) for context in stored]}
+
+        # With a checkpointer, `thread_id` identifies the run so that it can be resumed after a crash
+        if thread_id != None and self.graph.checkpointer != None:
+            result = await resume_or_invoke(self.graph, state, {"configurable": {"thread_id": thread_id}})
+        else:
+            result = await self.graph.ainvoke(state)
+        if key != None:
+            self.store.put(key, [Context.model_validate(context).model_dump() for context in result["contexts"]])
+        return result
+
+    def model_id(self):
+        # A router serves each node from its own model, so every model that can preprocess is part of the identity
+        routes_for = getattr(self.model, "routes_for", None)
+        return routes_for("preprocess") if routes_for != None else getattr(self.model, "model_name", None)
+
+    def log(self, event, **fields):
+        if self.run_log != None:
+            self.run_log.log(event, **fields)
@@ -0,0 +1,190 @@
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+
+from tokens import count_message_tokens
+
+# USD per million prompt and completion tokens
+PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+}
+
+current_node = contextvars.ContextVar("ihcl_current_node", default = None)
+current_node_start = contextvars.ContextVar("ihcl_current_node_start", default = None)
+current_call = contextvars.ContextVar("ihcl_current_call", default = None)
+
+_profiler = None
+
+def get_profiler():
+    return _profiler
+
+def set_profiler(profiler):
+    global _profiler
+    _profiler = profiler
+
+def estimate_cost(model_name, prompt_tokens, completion_tokens):
+    for name in sorted(PRICES, key = len, reverse = True):
+        if model_name != None and model_name.startswith(name):
+            prompt_price, completion_price = PRICES[name]
+            return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1e6
+    return 0.0
+
+# Records every node call, model call and context parse of a run while a profiler is set with `set_profiler`, and
+# summarizes them as a JSON report or in the Prometheus text format
+class Profiler:
+    def __init__(self):
+        self.records = []
+        self.__lock = threading.Lock()
+
+    def record(self, kind, name, wall, **fields):
+        with self.__lock:
+            self.records.append({"kind": kind, "name": name, "wall": wall} | fields)
+
+    def summary(self):
+        import numpy as np
+
+        groups = {}
+        for record in self.records:
+            groups.setdefault((record["kind"], record["name"]), []).append(record)
+
+        summary = []
+        for (kind, name), records in sorted(groups.items()):
+            walls = np.array([record["wall"] for record in records])
+            entry = {
+                "kind": kind,
+                "name": name,
+                "count": len(records),
+                "wall_total": float(walls.sum()),
+                "wall_p50": float(np.percentile(walls, 50)),
+                "wall_p95": float(np.percentile(walls, 95)),
+            }
+            for field in ["queue_wait", "prompt_tokens", "completion_tokens", "retries", "cost"]:
+                if field in records[0]:
+                    entry[f"{field}_total"] = sum(record[field] for record in records)
+            summary.append(entry)
+        return summary
+
+    def to_json(self):
+        return json.dumps({"summary": self.summary(), "records": self.records}, indent = 2)
+
+    def to_prometheus(self):
+        lines = []
+        def metric(name, kind, help):
+            lines.append(f"# HELP ihcl_{name} {help}")
+            lines.append(f"# TYPE ihcl_{name} {kind}")
+
+        summary = self.summary()
+        metric("duration_seconds", "summary", "Wall time of node calls, model calls and context parses")
+        for entry in summary:
+            labels = 'kind="{}",name="{}"'.format(entry["kind"], entry["name"])
+            lines.append(f'ihcl_duration_seconds{{{labels},quantile="0.5"}} {entry["wall_p50"]}')
+            lines.append(f'ihcl_duration_seconds{{{labels},quantile="0.95"}} {entry["wall_p95"]}')
+            lines.append(f'ihcl_duration_seconds_sum{{{labels}}} {entry["wall_total"]}')
+            lines.append(f'ihcl_duration_seconds_count{{{labels}}} {entry["count"]}')
+        for field, kind, help in [
+            ("queue_wait", "counter", "Seconds model calls spent waiting for rate limit budget or a concurrency slot"),
+            ("prompt_tokens", "counter", "Prompt tokens sent to the model"),
+            ("completion_tokens", "counter", "Completion tokens returned by the model"),
+            ("retries", "counter", "Retried model calls"),
+            ("cost", "counter", "Estimated model cost in USD"),
+        ]:
+            metric(f"{field}_total", kind, help)
+            for entry in summary:
+                if f"{field}_total" in entry:
+                    lines.append('ihcl_{}_total{{kind="{}",name="{}"}} {}'.format(field, entry["kind"], entry["name"], entry[f"{field}_total"]))
+        return "\n".join(lines) + "\n"
+
+    def export(self, fname):
+        # Writes `fname` as JSON and a Prometheus text file next to it
+        with open(fname, "w") as f:
+            f.write(self.to_json())
+        with open(os.path.splitext(fname)[0] + ".prom", "w") as f:
+            f.write(self.to_prometheus())
+
+def profiled(graph):
+    # Decorates an async graph node so that its wall time is recorded and model calls inside it know their node
+    def decorator(node):
+        name = f"{graph}.{node.__name__}"
+        @functools.wraps(node)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            token = current_node.set(name)
+            start_token = current_node_start.set(start)
+            try:
+                return await node(*args, **kwargs)
+            finally:
+                current_node.reset(token)
+                current_node_start.reset(start_token)
+                if _profiler != None:
+                    _profiler.record("node", name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def add_queue_wait(seconds):
+    call = current_call.get()
+    if call != None:
+        call["queue_wait"] += seconds
+
+def add_retry():
+    call = current_call.get()
+    if call != None:
+        call["retries"] += 1
+
+def record_parse(ftype, wall, cached = False):
+    if _profiler != None:
+        _profiler.record("parse", str(ftype), wall, cached = cached)
+
+# Wraps a chat model to record the wall time, queue wait, token usage, retries and estimated cost of every call
+class ProfiledChatModel:
+    def __init__(self, model):
+        self.model = model
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def with_structured_output(self, schema, **kwargs):
+        if _profiler == None or kwargs.get("include_raw", False):
+            return self.model.with_structured_output(schema, **kwargs)
+        return ProfiledRunnable(self.model.with_structured_output(schema, include_raw = True, **kwargs), getattr(self.model, "model_name", None))
+
+class ProfiledRunnable:
+    def __init__(self, runnable, model_name):
+        self.runnable = runnable
+        self.model_name = model_name
+
+    async def ainvoke(self, messages, *args, **kwargs):
+        call = {"queue_wait": 0.0, "retries": 0}
+        token = current_call.set(call)
+        start = time.perf_counter()
+        try:
+            response = await self.runnable.ainvoke(messages, *args, **kwargs)
+        finally:
+            current_call.reset(token)
+        wall = time.perf_counter() - start
+
+        # Models that ignore `include_raw` return the parsed object, so estimate their prompt tokens instead
+        if not (isinstance(response, dict) and "parsed" in response):
+            response = {"raw": None, "parsed": response, "parsing_error": None}
+        usage = getattr(response["raw"], "usage_metadata", None) or {}
+        prompt_tokens = usage.get("input_tokens", count_message_tokens(messages, self.model_name))
+        completion_tokens = usage.get("output_tokens", 0)
+        if _profiler != None:
+            _profiler.record(
+                "llm", current_node.get() or "unknown", wall,
+                queue_wait = call["queue_wait"],
+                prompt_tokens = prompt_tokens,
+                completion_tokens = completion_tokens,
+                retries = call["retries"],
+                cost = estimate_cost(self.model_name, prompt_tokens, completion_tokens)
+            )
+        if response.get("parsing_error") != None:
+            raise response["parsing_error"]
+        return response["parsed"]
+
+    def invoke(self, *args, **kwargs):
+        return asyncio.run(self.ainvoke(*args, **kwargs))
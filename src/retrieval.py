@@ -0,0 +1,89 @@
+import collections
+import re
+import numpy as np
+
+from preprocess import Context
+from tokens import split_tokens
+
+def tokenize(text):
+    return re.findall(r"\w+", text.lower())
+
+# BM25 index over passages of the (preprocessed) contexts. Each context is split into passages of at most
+# `passage_tokens` tokens, and `top_contexts` returns only the passages most relevant to a set of queries.
+# Passages are tokenized once into an inverted index (term -> passages and term counts); `extended` layers the
+# passages of more contexts over an index without tokenizing its own passages again, e.g. to index the fixed contexts
+# of a run once and each posting on top of them. BM25 weights depend on every passage, so they are computed per query.
+class RelevanceIndex:
+    def __init__(self, contexts, passage_tokens = 200, k1 = 1.5, b = 0.75, base = None):
+        self.passage_tokens = passage_tokens
+        self.k1 = k1
+        self.b = b
+        self.base = base
+        offset = len(base.contexts) if base != None else 0
+        self.contexts = (base.contexts if base != None else []) + list(contexts)
+        passages = []
+        for cid, context in enumerate(contexts, start = offset):
+            for passage in split_tokens(context.content or "", passage_tokens):
+                passages.append((cid, passage))
+        self.passages = (base.passages if base != None else []) + passages
+
+        postings = {}
+        lengths = []
+        for pid, (cid, passage) in enumerate(passages, start = len(self.passages) - len(passages)):
+            terms = collections.Counter(tokenize(f"{self.contexts[cid].description} {passage}"))
+            lengths.append(sum(terms.values()))
+            for term, count in terms.items():
+                pids, counts = postings.setdefault(term, ([], []))
+                pids.append(pid)
+                counts.append(count)
+        self.postings = {
+            term: (np.array(pids, dtype = np.intp), np.array(counts, dtype = np.float32)) for term, (pids, counts) in postings.items()
+        }
+        self.lengths = np.concatenate([base.lengths if base != None else np.zeros(0, dtype = np.float32), np.array(lengths, dtype = np.float32)])
+
+    def extended(self, contexts):
+        return RelevanceIndex(contexts, passage_tokens = self.passage_tokens, k1 = self.k1, b = self.b, base = self)
+
+    def term(self, term):
+        # The passages containing `term` and how often, across this index and the ones it extends
+        own = self.postings.get(term)
+        inherited = self.base.term(term) if self.base != None else None
+        if own == None or inherited == None:
+            return own if own != None else inherited
+        return np.concatenate([inherited[0], own[0]]), np.concatenate([inherited[1], own[1]])
+
+    def scores(self, query):
+        npassages = len(self.passages)
+        scores = np.zeros(npassages, dtype = np.float32)
+        avg_length = self.lengths.mean() if npassages > 0 else 0.0
+        if avg_length == 0:
+            return scores
+        norm = self.k1 * (1 - self.b + self.b * self.lengths / avg_length)
+        for term in tokenize(query):
+            found = self.term(term)
+            if found == None:
+                continue
+            pids, tf = found
+            idf = np.log((npassages - len(pids) + 0.5) / (len(pids) + 0.5) + 1)
+            scores[pids] += idf * tf * (self.k1 + 1) / (tf + norm[pids])
+        return scores
+
+    def search(self, query, k):
+        scores = self.scores(query)
+        top = np.argsort(-scores, kind = "stable")[:k]
+        return [pid for pid in top if scores[pid] > 0]
+
+    def top_contexts(self, queries, k):
+        selected = set()
+        for query in queries:
+            selected.update(self.search(query, k))
+
+        # Group the selected passages back into their contexts, keeping the original order
+        grouped = {}
+        for pid in sorted(selected):
+            cid, passage = self.passages[pid]
+            grouped.setdefault(cid, []).append(passage)
+        return [
+            Context(description = self.contexts[cid].description, content = "\n\n".join(passages), metadata = self.contexts[cid].metadata)
+            for cid, passages in grouped.items()
+        ]
@@ -0,0 +1,80 @@
+import asyncio
+
+from engine import BoundedChatModel
+from profiling import current_node
+
+# Serves every graph node from the model its route names. Routes map a node ("preprocess.cleaner") or a whole graph
+# ("preprocess") to a model name, and anything unrouted uses `default`. Models listed in `concurrency` are also capped
+# to that many in-flight calls of their own, e.g. to keep a local endpoint from being overloaded. A call takes its
+# model's slot before a slot of the engine's global cap (see `bounded`), so calls queued on a throttled model never
+# hold global slots that other models could use.
+class ModelRouter:
+    def __init__(self, models, routes = None, default = "default", concurrency = None):
+        assert default in models, ValueError(f"The default model `{default}` is not one of the models")
+        self.routes = dict(routes or {})
+        for target, name in self.routes.items():
+            assert name in models, ValueError(f"The route for `{target}` names an unknown model `{name}`")
+        self.default = default
+        self.semaphores = {
+            name: asyncio.Semaphore(limit) for name, limit in (concurrency or {}).items() if limit != None and name in models
+        }
+        self.unbounded = dict(models)
+        self.models = {name: self.route_bounded(name, model) for name, model in models.items()}
+
+    def route_bounded(self, name, model):
+        return BoundedChatModel(model, self.semaphores[name]) if name in self.semaphores else model
+
+    def bounded(self, semaphore):
+        # A copy of this router whose models also hold `semaphore` (e.g. the engine's global cap) for every call,
+        # taken after their own cap
+        router = ModelRouter.__new__(ModelRouter)
+        router.__dict__.update(self.__dict__)
+        router.models = {name: self.route_bounded(name, BoundedChatModel(model, semaphore)) for name, model in self.unbounded.items()}
+        return router
+
+    def name_for(self, node):
+        if node != None:
+            if node in self.routes:
+                return self.routes[node]
+            graph = node.split(".")[0]
+            if graph in self.routes:
+                return self.routes[graph]
+        return self.default
+
+    def model_for(self, node):
+        return self.models[self.name_for(node)]
+
+    @property
+    def model_name(self):
+        return getattr(self.model_for(current_node.get()), "model_name", None)
+
+    def routes_for(self, graph):
+        # The model of every route that can serve a node of `graph`, e.g. to key cached results of the graph
+        routes = {target: name for target, name in self.routes.items() if target.split(".")[0] == graph}
+        routes["default"] = self.default
+        return {target: getattr(self.models[name], "model_name", name) for target, name in sorted(routes.items())}
+
+    def with_structured_output(self, schema, **kwargs):
+        return self.model_for(current_node.get()).with_structured_output(schema, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.models[self.default], name)
+
+def load_router(config, make_model):
+    # `config` is a routing config with `models` (name -> keyword arguments of `make_model`, plus an optional
+    # `concurrency`), `routes` and `default`, e.g.
+    #
+    #   default: large
+    #   models:
+    #     large: {model: gpt-4o-mini}
+    #     local: {model: llama3.1, base_url: "http://localhost:11434/v1", api_key: ollama, concurrency: 4}
+    #   routes:
+    #     preprocess: local
+    #     contextifier.tagger: local
+    models = {}
+    concurrency = {}
+    for name, spec in config["models"].items():
+        spec = dict(spec)
+        concurrency[name] = spec.pop("concurrency", None)
+        models[name] = make_model(**spec)
+    return ModelRouter(models, routes = config.get("routes"), default = config.get("default", "default"), concurrency = concurrency)
@@ -0,0 +1,123 @@
+import contextvars
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+
+from profiling import current_node, current_node_start
+
+CONTENT_MODES = ["truncate", "hash", "full"]
+
+current_run = contextvars.ContextVar("ihcl_current_run", default = None)
+
+# Structured JSONL log of a run. `log` only encodes the event and puts it on a queue, so graph nodes and worker threads
+# never wait on the file; a background thread writes the events in batches and rotates the file once it grows beyond
+# `max_bytes`, keeping `backups` old files (`run.log.1` is the most recent). Every event records the time, the run id,
+# the graph node it was logged from and how long that node has been running. Strings longer than `max_chars` (e.g. the
+# content of contexts) are truncated, replaced by their hash, or kept in full depending on `content`.
+class RunLog:
+    def __init__(self, path, content = "truncate", max_chars = 200, max_bytes = 64 * 1024 * 1024, backups = 3, batch_size = 256, flush_interval = 0.5):
+        assert content in CONTENT_MODES, ValueError(f"`content` must be one of {CONTENT_MODES}")
+        self.path = path
+        self.content = content
+        self.max_chars = max_chars
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.events = 0
+        self.start = time.perf_counter()
+        self.__queue = queue.SimpleQueue()
+        self.__file = open(path, "w")
+        self.__writer = threading.Thread(target = self.write_loop, name = "ihcl-runlog", daemon = True)
+        self.__writer.start()
+
+    def log(self, event, **fields):
+        node = current_node.get()
+        node_start = current_node_start.get()
+        now = time.perf_counter()
+        entry = {
+            "ts": time.time(),
+            "elapsed": round(now - self.start, 6),
+            "run": current_run.get(),
+            "node": node,
+            "node_elapsed": round(now - node_start, 6) if node_start != None else None,
+            "event": event
+        } | {name: self.encode(value) for name, value in fields.items()}
+        self.__queue.put(entry)
+
+    def encode(self, value):
+        if hasattr(value, "model_dump"):
+            value = value.model_dump()
+        if isinstance(value, dict):
+            return {str(k): self.encode(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self.encode(v) for v in value]
+        if isinstance(value, str):
+            return self.text(value)
+        if value == None or isinstance(value, (bool, int, float)):
+            return value
+        return self.text(str(value))
+
+    def text(self, text):
+        if self.content == "full" or len(text) <= self.max_chars:
+            return text
+        if self.content == "hash":
+            return "sha256:{} ({} chars)".format(hashlib.sha256(text.encode()).hexdigest()[:16], len(text))
+        return "{}... (+{} chars)".format(text[:self.max_chars], len(text) - self.max_chars)
+
+    def write_loop(self):
+        closed = False
+        while not closed:
+            try:
+                batch = [self.__queue.get(timeout = self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.__queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                closed = True
+                batch = [entry for entry in batch if entry != None]
+            if len(batch) > 0:
+                self.write(batch)
+
+    def write(self, batch):
+        data = "".join(json.dumps(entry, default = str) + "\n" for entry in batch)
+        if self.__file.tell() > 0 and self.__file.tell() + len(data) > self.max_bytes:
+            self.rotate()
+        self.__file.write(data)
+        self.__file.flush()
+        self.events += len(batch)
+
+    def rotate(self):
+        self.__file.close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        self.__file = open(self.path, "w")
+
+    def close(self):
+        # Writes every queued event before returning
+        if self.__writer.is_alive():
+            self.__queue.put(None)
+            self.__writer.join()
+        self.__file.close()
+
+    def __str__(self):
+        return "RunLog(path: {}, events: {})".format(self.path, self.events)
+
+def describe_contexts(contexts):
+    # The description and size of every context, with its content (truncated or hashed when the event is encoded)
+    described = []
+    for context in contexts:
+        context = context.model_dump() if hasattr(context, "model_dump") else context
+        content = context.get("content") or ""
+        described.append({"description": context.get("description"), "chars": len(content), "content": content})
+    return described
@@ -0,0 +1,151 @@
+import asyncio
+import collections
+import random
+import threading
+import time
+
+from tokens import count_message_tokens
+from profiling import add_queue_wait, add_retry
+
+WINDOW = 60.0
+
+def is_retryable(inst):
+    if isinstance(inst, (asyncio.TimeoutError, TimeoutError)):
+        return True
+    if getattr(inst, "status_code", None) in (408, 429):
+        return True
+    return type(inst).__name__ in ("RateLimitError", "APITimeoutError", "TimeoutException", "ReadTimeout", "ConnectTimeout")
+
+def retry_after(inst):
+    response = getattr(inst, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+# Admits model calls against requests-per-minute and tokens-per-minute budgets over a sliding one minute window, and
+# retries rate-limited or timed out calls with jittered exponential backoff.
+class Scheduler:
+    def __init__(self, rpm = None, tpm = None, max_retries = 6, base_delay = 1.0, max_delay = 60.0, timeout = None, completion_tokens = 256):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        # Providers count the expected completion towards TPM, so reserve some tokens for it up front
+        self.completion_tokens = completion_tokens
+
+        self.__lock = threading.Lock()
+        self.__requests = collections.deque()
+        self.__tokens = collections.deque()
+        self.__used_tokens = 0
+
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.admitted = 0
+        self.retries = 0
+        self.total_wait = 0.0
+
+    def wait_time(self, now, tokens):
+        while self.__requests and now - self.__requests[0] >= WINDOW:
+            self.__requests.popleft()
+        while self.__tokens and now - self.__tokens[0][0] >= WINDOW:
+            self.__used_tokens -= self.__tokens.popleft()[1]
+
+        wait = 0.0
+        if self.rpm != None and len(self.__requests) >= self.rpm:
+            wait = max(wait, self.__requests[len(self.__requests) - self.rpm] + WINDOW - now)
+        # A single call larger than the whole budget is admitted once the window is empty instead of waiting forever
+        if self.tpm != None and self.__used_tokens + tokens > self.tpm and self.__tokens:
+            freed = self.__used_tokens + tokens - self.tpm
+            for t, n in self.__tokens:
+                freed -= n
+                if freed <= 0:
+                    break
+            wait = max(wait, t + WINDOW - now)
+        return wait
+
+    async def acquire(self, tokens):
+        tokens += self.completion_tokens
+        start = time.monotonic()
+        with self.__lock:
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        try:
+            while True:
+                with self.__lock:
+                    now = time.monotonic()
+                    wait = self.wait_time(now, tokens)
+                    if wait <= 0:
+                        self.__requests.append(now)
+                        self.__tokens.append((now, tokens))
+                        self.__used_tokens += tokens
+                        self.admitted += 1
+                        break
+                await asyncio.sleep(wait)
+        finally:
+            with self.__lock:
+                self.queue_depth -= 1
+                self.total_wait += time.monotonic() - start
+        wait = time.monotonic() - start
+        add_queue_wait(wait)
+        return wait
+
+    def backoff(self, attempt, inst = None):
+        delay = retry_after(inst)
+        if delay != None:
+            return delay
+        # Full jitter keeps retrying callers from synchronizing into another burst
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def call(self, fn, tokens):
+        attempt = 0
+        while True:
+            await self.acquire(tokens)
+            try:
+                if self.timeout != None:
+                    return await asyncio.wait_for(fn(), self.timeout)
+                return await fn()
+            except Exception as inst:
+                if attempt >= self.max_retries or not is_retryable(inst):
+                    raise
+                with self.__lock:
+                    self.retries += 1
+                add_retry()
+                await asyncio.sleep(self.backoff(attempt, inst))
+                attempt += 1
+
+    def mean_wait(self):
+        return self.total_wait / self.admitted if self.admitted > 0 else 0.0
+
+    def __str__(self):
+        return "Scheduler(admitted: {}, retries: {}, queue depth: {}, max queue depth: {}, mean wait: {:.2f}s)".format(
+            self.admitted, self.retries, self.queue_depth, self.max_queue_depth, self.mean_wait()
+        )
+
+# Wraps a chat model so that every `ainvoke` is admitted and retried by a `Scheduler`
+class ScheduledChatModel:
+    def __init__(self, model, scheduler):
+        self.model = model
+        self.scheduler = scheduler
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def with_structured_output(self, schema, **kwargs):
+        return ScheduledRunnable(self.model.with_structured_output(schema, **kwargs), self.scheduler, getattr(self.model, "model_name", None))
+
+class ScheduledRunnable:
+    def __init__(self, runnable, scheduler, model_name = None):
+        self.runnable = runnable
+        self.scheduler = scheduler
+        self.model_name = model_name
+
+    def invoke(self, *args, **kwargs):
+        return self.runnable.invoke(*args, **kwargs)
+
+    async def ainvoke(self, messages, *args, **kwargs):
+        tokens = count_message_tokens(messages, self.model_name)
+        return await self.scheduler.call(lambda: self.runnable.ainvoke(messages, *args, **kwargs), tokens)
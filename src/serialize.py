@@ -0,0 +1,36 @@
+import re
+
+# Compact prompt format for contexts. Python reprs of the pydantic models repeat field names, metadata and escaped
+# newlines in every prompt; instead each description is written once as a header followed by its contents, with
+# whitespace normalized and repeated paragraphs dropped.
+
+def normalize(text):
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = re.sub(r"[ \t\f\v]+", " ", text)
+    text = re.sub(r" ?\n ?", "\n", text)
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+def field(context, name):
+    return context.get(name) if isinstance(context, dict) else getattr(context, name)
+
+def serialize_contexts(contexts):
+    grouped = {}
+    for context in contexts:
+        paragraphs = grouped.setdefault(normalize(field(context, "description") or ""), [])
+        content = field(context, "content")
+        if content == None:
+            continue
+        for paragraph in normalize(content).split("\n\n"):
+            if paragraph != "" and paragraph not in paragraphs:
+                paragraphs.append(paragraph)
+    return "\n\n".join(
+        f"# {description}\n" + "\n\n".join(paragraphs) if len(paragraphs) > 0 else f"# {description}"
+        for description, paragraphs in grouped.items()
+    )
+
+def serialize_context(context):
+    return serialize_contexts([context])
+
+def serialize_descriptions(descriptions):
+    # Numbered so that the model can return the descriptions in the same order
+    return "\n".join(f"{i + 1}. {normalize(description)}" for i, description in enumerate(descriptions))
@@ -0,0 +1,58 @@
+import asyncio
+import hashlib
+import json
+
+def extract_bracketed(content, brackets):
+    # Returns the unique texts enclosed by `brackets`, in order of appearance, or None when the brackets are nested or
+    # unbalanced and the template needs a closer (LLM) read
+    left, right = brackets
+    if left == "" or right == "":
+        return None
+
+    found = []
+    i = 0
+    while True:
+        start = content.find(left, i)
+        stray = content.find(right, i)
+        if start == -1:
+            if stray != -1 and left != right:
+                return None
+            break
+        if left != right and stray != -1 and stray < start:
+            return None
+        end = content.find(right, start + len(left))
+        if end == -1:
+            return None
+        nested = content.find(left, start + len(left))
+        if left != right and nested != -1 and nested < end:
+            return None
+        found.append(content[start + len(left):end].strip())
+        i = end + len(right)
+    return list(dict.fromkeys(found))
+
+def template_key(content, brackets):
+    return hashlib.sha256(json.dumps([content, list(brackets)]).encode()).hexdigest()
+
+# Memoizes per-template analysis by template content hash. Concurrent callers for the same template share a single
+# in-flight computation.
+class TemplateAnalysisCache:
+    def __init__(self):
+        self.__results = {}
+        self.__pending = {}
+
+    async def get(self, key, compute):
+        if key in self.__results:
+            return self.__results[key]
+        if key in self.__pending:
+            return await asyncio.shield(self.__pending[key])
+
+        task = asyncio.ensure_future(compute())
+        self.__pending[key] = task
+        try:
+            self.__results[key] = await asyncio.shield(task)
+        finally:
+            self.__pending.pop(key, None)
+        return self.__results[key]
+
+    def __contains__(self, key):
+        return key in self.__results
@@ -0,0 +1,71 @@
+import functools
+import re
+from rich import print
+
+DEFAULT_ENCODING = "cl100k_base"
+
+@functools.cache
+def encoding(model = None):
+    try:
+        import tiktoken
+        if model != None:
+            try:
+                return tiktoken.encoding_for_model(model)
+            except KeyError:
+                pass
+        return tiktoken.get_encoding(DEFAULT_ENCODING)
+    except Exception as inst:
+        # NOTE: tiktoken downloads its BPE files on first use, so fall back to a character heuristic when offline
+        print(f"[yellow]Could not load a tiktoken encoding ({type(inst).__name__}); estimating tokens from characters[/yellow]")
+        return None
+
+def count_tokens(text, model = None):
+    if not text:
+        return 0
+    enc = encoding(model)
+    if enc == None:
+        return len(text) // 4 + 1
+    return len(enc.encode(text, disallowed_special = ()))
+
+def count_message_tokens(messages, model = None):
+    # Mirrors OpenAI's chat accounting: a few tokens of framing per message plus the reply primer
+    return sum(count_tokens(str(message.content), model) + 4 for message in messages) + 3
+
+def split_tokens(text, max_tokens, model = None):
+    # Splits `text` on paragraph boundaries into chunks of at most `max_tokens`, evening out the chunk sizes so that
+    # parallel workers get similar amounts of work
+    total = count_tokens(text, model)
+    if total <= max_tokens:
+        return [text]
+    nchunks = -(-total // max_tokens)
+    target = -(-total // nchunks)
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    for paragraph in re.split(r"\n\s*\n", text):
+        if paragraph.strip() == "":
+            continue
+        ntokens = count_tokens(paragraph, model) + 1
+        if ntokens > max_tokens:
+            if current:
+                chunks.append("\n\n".join(current))
+                current, current_tokens = [], 0
+            chunks.extend(hard_split(paragraph, max_tokens, model))
+            continue
+        if current and current_tokens + ntokens > target:
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(paragraph)
+        current_tokens += ntokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+def hard_split(text, max_tokens, model = None):
+    enc = encoding(model)
+    if enc == None:
+        size = max(1, (max_tokens - 1) * 4)
+        return [text[i:i + size] for i in range(0, len(text), size)]
+    tokens = enc.encode(text, disallowed_special = ())
+    return [enc.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens)]
@@ -0,0 +1,77 @@
+import asyncio
+import time
+import typing
+from pydantic import BaseModel
+from langchain_core.messages import AIMessage
+
+from tokens import count_message_tokens
+
+# A deterministic stand-in for a chat model. `with_structured_output(schema)` returns schema-valid objects built from
+# the field annotations, after an optional artificial `latency`, and the model records how many calls were in flight.
+class FakeChatModel:
+    model_name = "fake"
+
+    def __init__(self, latency = 0.0):
+        self.latency = latency
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def with_structured_output(self, schema, **kwargs):
+        return FakeStructuredOutput(self, schema, kwargs.get("include_raw", False))
+
+class FakeStructuredOutput:
+    def __init__(self, model, schema, include_raw = False):
+        self.model = model
+        self.schema = schema
+        self.include_raw = include_raw
+
+    def response(self, messages):
+        parsed = fake_instance(self.schema)
+        if not self.include_raw:
+            return parsed
+        # Mirrors the usage metadata reported by real chat models
+        prompt_tokens = count_message_tokens(messages, self.model.model_name)
+        completion_tokens = len(parsed.model_dump_json()) // 4 + 1
+        raw = AIMessage(content = "", usage_metadata = {
+            "input_tokens": prompt_tokens, "output_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens
+        })
+        return {"raw": raw, "parsed": parsed, "parsing_error": None}
+
+    def invoke(self, messages, *args, **kwargs):
+        self.model.calls += 1
+        time.sleep(self.model.latency)
+        return self.response(messages)
+
+    async def ainvoke(self, messages, *args, **kwargs):
+        self.model.calls += 1
+        self.model.in_flight += 1
+        self.model.max_in_flight = max(self.model.max_in_flight, self.model.in_flight)
+        try:
+            await asyncio.sleep(self.model.latency)
+            return self.response(messages)
+        finally:
+            self.model.in_flight -= 1
+
+def fake_instance(schema):
+    return schema(**{name: fake_value(field.annotation, field.metadata) for name, field in schema.model_fields.items()})
+
+def fake_value(annotation, metadata = ()):
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+    if origin is typing.Union:
+        return fake_value([arg for arg in args if arg is not type(None)][0])
+    if origin is list:
+        length = max([getattr(m, "min_length", None) or 0 for m in metadata] + [1])
+        return [fake_value(args[0]) for _ in range(length)]
+    if origin is tuple:
+        return tuple(fake_value(arg) for arg in args)
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return fake_instance(annotation)
+    if annotation is bool:
+        return True
+    if annotation is int:
+        return 0
+    if annotation is float:
+        return 0.0
+    return "fake"
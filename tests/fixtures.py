@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+import docx
+
+def template():
+    # The one-field template most engine tests fill, as `ihcl.load_template` returns it
+    return {
+        "content": "Dear [company]",
+        "description": "template",
+        "metadata": {"to_substitute": [], "brackets": ("[", "]")}
+    }
+
+# Gives every test its own temporary directory (removed afterwards) and a fresh `template()`
+class TempDirTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.template = template()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmpdir.name, name)
+
+    def write(self, name, content):
+        fname = self.path(name)
+        with open(fname, "w") as f:
+            f.write(content)
+        return fname
+
+    def write_contexts(self, npostings, posting = "job posting {}"):
+        # One resume as the fixed context and `npostings` single-file postings
+        self.fixed_contexts = [{"description": "resume", "path": self.write("resume.txt", "my resume")}]
+        self.variable_contexts = [
+            [{"description": "job", "path": self.write(f"job{i}.txt", posting.format(i))}] for i in range(npostings)
+        ]
+
+def write_txt(fname, paragraphs):
+    with open(fname, "w") as f:
+        f.write("\n\n".join(paragraphs))
+    return fname
+
+def write_docx(fname, paragraphs):
+    doc = docx.Document()
+    for paragraph in paragraphs:
+        doc.add_paragraph(paragraph)
+    doc.save(fname)
+    return fname
+
+def write_pdf(fname, pages):
+    # Writes a minimal PDF with one line of Helvetica text per entry of `pages`
+    def escape(text):
+        return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    npages = len(pages)
+    font = 3 + 2 * npages
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [{}] /Count {} >>".format(" ".join(f"{3 + 2 * i} 0 R" for i in range(npages)), npages)
+    ]
+    for i, text in enumerate(pages):
+        stream = f"BT /F1 12 Tf 72 720 Td ({escape(text)}) Tj ET"
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R /Resources << /Font << /F1 {font} 0 R >> >> >>")
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for i, obj in enumerate(objects):
+        offsets.append(len(out))
+        out += f"{i + 1} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(fname, "wb") as f:
+        f.write(out)
+    return fname
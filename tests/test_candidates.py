@@ -0,0 +1,109 @@
+import unittest
+import asyncio
+import os
+import re
+import sys
+# Get the absolute path of the project's root directory
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Add the 'src' directory to the Python path
+src_dir = os.path.join(project_root, 'src')
+sys.path.append(src_dir)
+from engine import Engine
+from contextify import FilledTemplates
+from fake_model import FakeChatModel, FakeStructuredOutput
+from fixtures import TempDirTestCase
+from ihcl import build_engine
+import typer
+
+# Answers the numbered candidate requests of parallel mode with `text` ("candidate <n>" by default, or a function of
+# the candidate number), later candidates finishing first
+class CandidateChatModel(FakeChatModel):
+    def __init__(self, noutputs, text = "candidate {}"):
+        super().__init__()
+        self.noutputs = noutputs
+        self.text = text
+        self.candidate_calls = 0
+        self.cancelled = 0
+
+    def with_structured_output(self, schema, **kwargs):
+        if schema is not FilledTemplates:
+            return super().with_structured_output(schema, **kwargs)
+        model = self
+        class CandidateOutput(FakeStructuredOutput):
+            async def ainvoke(self, messages, *args, **kwargs):
+                match = re.search(r"version (\d+) of", messages[-1].content)
+                candidate = int(match.group(1)) if match != None else 0
+                model.candidate_calls += 1
+                try:
+                    await asyncio.sleep(0.02 * (model.noutputs - candidate))
+                except asyncio.CancelledError:
+                    model.cancelled += 1
+                    raise
+                text = model.text(candidate) if callable(model.text) else model.text.format(candidate)
+                parsed = FilledTemplates(filled_templates = [text])
+                return {"raw": None, "parsed": parsed, "parsing_error": None} if self.include_raw else parsed
+        return CandidateOutput(self, schema, kwargs.get("include_raw", False))
+
+class TestCandidates(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.write_contexts(1)
+
+    def run_engine(self, model, **kwargs):
+        streamed = []
+        engine = Engine(model, **kwargs)
+        try:
+            responses = asyncio.run(engine.run(self.fixed_contexts, self.variable_contexts, self.template,
+                                               on_candidate = lambda pid, i, txt: streamed.append((pid, i, txt))))
+        finally:
+            engine.close()
+        return responses, streamed
+
+    def test_parallel_candidates_stream_in_completion_order(self):
+        model = CandidateChatModel(noutputs = 4)
+        responses, streamed = self.run_engine(model, noutputs = 4, parallel_candidates = True)
+        self.assertEqual(model.candidate_calls, 4)
+        self.assertEqual(streamed, [(0, i, f"candidate {4 - i}") for i in range(4)])
+        self.assertEqual(responses[0], [txt for _, _, txt in streamed])
+
+    def test_first_cancels_the_remaining_candidates(self):
+        model = CandidateChatModel(noutputs = 4)
+        responses, streamed = self.run_engine(model, noutputs = 4, parallel_candidates = True, first = 2)
+        self.assertEqual(responses[0], ["candidate 4", "candidate 3"])
+        self.assertEqual(len(streamed), 2)
+        self.assertEqual(model.cancelled, 2)
+
+    def test_unfilled_candidates_are_kept_when_no_candidate_fills_every_field(self):
+        model = CandidateChatModel(noutputs = 3, text = "Dear [company] {}")
+        responses, streamed = self.run_engine(model, noutputs = 3, parallel_candidates = True)
+        self.assertEqual(len(responses[0]), 3)
+        self.assertEqual([txt for _, _, txt in streamed], responses[0])
+
+    def test_fields_are_checked_against_the_template_not_the_tagger(self):
+        # The fake tagger words the field "fake", while the template's field is "company"; the two candidates that
+        # finish first leave it unfilled
+        model = CandidateChatModel(noutputs = 4, text = lambda candidate: f"Dear [company] {candidate}" if candidate > 2 else f"Dear Acme {candidate}")
+        responses, streamed = self.run_engine(model, noutputs = 4, parallel_candidates = True, first = 2)
+        self.assertEqual(responses[0], ["Dear Acme 2", "Dear Acme 1"])
+        self.assertEqual([txt for _, _, txt in streamed], responses[0])
+
+    def test_posting_fails_when_every_candidate_is_empty(self):
+        model = CandidateChatModel(noutputs = 3, text = " ")
+        responses, streamed = self.run_engine(model, noutputs = 3, parallel_candidates = True)
+        self.assertIsInstance(responses[0], ValueError)
+        self.assertEqual(streamed, [])
+
+    def test_first_requires_parallel_candidates(self):
+        for kwargs in [{"first": 2}, {"first": 4, "parallel_candidates": True}, {"first": 0, "parallel_candidates": True}]:
+            with self.assertRaises(typer.BadParameter):
+                build_engine(candidates = 3, **kwargs)
+
+    def test_single_call_still_streams_every_candidate(self):
+        model = CandidateChatModel(noutputs = 3)
+        responses, streamed = self.run_engine(model)
+        self.assertEqual(model.candidate_calls, 1)
+        self.assertEqual([txt for _, _, txt in streamed], responses[0])
+
+if __name__ == "__main__":
+    unittest.main()
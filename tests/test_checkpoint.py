@@ -0,0 +1,73 @@
+import unittest
+import asyncio
+import os
+import sys
+# Get the absolute path of the project's root directory
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Add the 'src' directory to the Python path
+src_dir = os.path.join(project_root, 'src')
+sys.path.append(src_dir)
+from checkpoint import SqliteSaver
+from engine import Engine
+from fake_model import FakeChatModel
+from fixtures import TempDirTestCase
+
+class FlakyModel(FakeChatModel):
+    # Fails every final contextifier call while `broken` is set
+    broken = True
+
+    def with_structured_output(self, schema, **kwargs):
+        runnable = super().with_structured_output(schema, **kwargs)
+        if self.broken and schema.__name__ == "FilledTemplates":
+            async def fail(*args, **kwargs):
+                raise RuntimeError("provider went away")
+            runnable.ainvoke = fail
+        return runnable
+
+class TestCheckpointedRuns(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.db = self.path("checkpoints.sqlite")
+        self.write_contexts(3, posting = "posting {}")
+
+    def run_engine(self, model):
+        engine = Engine(model, checkpointer = SqliteSaver(self.db))
+        try:
+            return asyncio.run(engine.run(self.fixed_contexts, self.variable_contexts, self.template))
+        finally:
+            engine.close()
+
+    def test_resume_after_failure(self):
+        model = FlakyModel()
+        responses = self.run_engine(model)
+        self.assertTrue(all(isinstance(response, RuntimeError) for response in responses))
+        self.assertGreater(model.calls, 0)
+
+        # Only the failed contextifier node runs again, once per posting
+        model = FlakyModel()
+        model.broken = False
+        responses = self.run_engine(model)
+        self.assertTrue(all(isinstance(response, list) for response in responses))
+        self.assertEqual(model.calls, len(self.variable_contexts))
+
+        # Finished postings are skipped entirely
+        model = FlakyModel()
+        model.broken = False
+        self.run_engine(model)
+        self.assertEqual(model.calls, 0)
+
+    def test_saver_lists_checkpoints(self):
+        model = FlakyModel()
+        model.broken = False
+        self.run_engine(model)
+        saver = SqliteSaver(self.db)
+        checkpoints = list(saver.list(None))
+        self.assertGreater(len(checkpoints), 0)
+        thread_id = checkpoints[0].config["configurable"]["thread_id"]
+        latest = saver.get_tuple({"configurable": {"thread_id": thread_id}})
+        self.assertEqual(len(list(saver.list({"configurable": {"thread_id": thread_id}}, limit = 1))), 1)
+        self.assertIsNotNone(latest.checkpoint)
+
+if __name__ == "__main__":
+    unittest.main()
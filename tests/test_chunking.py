@@ -0,0 +1,44 @@
+import unittest
+import os
+import sys
+# Get the absolute path of the project's root directory
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Add the 'src' directory to the Python path
+src_dir = os.path.join(project_root, 'src')
+sys.path.append(src_dir)
+from tokens import count_tokens, split_tokens
+from preprocess import Preprocess
+from fake_model import FakeChatModel
+
+class TestSplitTokens(unittest.TestCase):
+    def test_short_text_is_one_chunk(self):
+        self.assertEqual(split_tokens("a short paragraph", 100), ["a short paragraph"])
+
+    def test_chunks_are_bounded_and_keep_paragraphs(self):
+        paragraphs = [f"paragraph number {i} " + "word " * 20 for i in range(30)]
+        chunks = split_tokens("\n\n".join(paragraphs), 100)
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(count_tokens(chunk), 100)
+        self.assertEqual("\n\n".join(chunks).split("\n\n"), paragraphs)
+
+    def test_oversized_paragraph_is_split(self):
+        chunks = split_tokens("word " * 1000, 50)
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(count_tokens(chunk), 50)
+
+class TestChunkedCleaner(unittest.TestCase):
+    def test_large_context_is_cleaned_in_chunks(self):
+        model = FakeChatModel()
+        preprocess = Preprocess(model, chunk_tokens = 100)
+        content = "\n\n".join(f"paragraph number {i} " + "word " * 20 for i in range(30))
+        chunks = split_tokens(content, 100)
+        result = preprocess.invoke([{"description": "resume", "content": content, "metadata": {"processed": False}}])
+        # one call per chunk, one for the categorizer and one for the summarizer
+        self.assertEqual(model.calls, len(chunks) + 2)
+        self.assertEqual(len(result["contexts"]), 1)
+
+if __name__ == "__main__":
+    unittest.main()
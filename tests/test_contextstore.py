@@ -0,0 +1,56 @@
+import unittest
+import asyncio
+import os
+import sys
+# Get the absolute path of the project's root directory
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Add the 'src' directory to the Python path
+src_dir = os.path.join(project_root, 'src')
+sys.path.append(src_dir)
+from contextstore import ContextStore
+from engine import Engine
+from fake_model import FakeChatModel
+from fixtures import TempDirTestCase
+
+class TestContextStore(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.store = ContextStore(root = self.path("store"))
+        self.write_contexts(3)
+
+    def run_engine(self, template = None):
+        model = FakeChatModel()
+        engine = Engine(model, store = self.store)
+        try:
+            asyncio.run(engine.run(self.fixed_contexts, self.variable_contexts, template or self.template))
+        finally:
+            engine.close()
+        return model.calls
+
+    def test_key_covers_content_description_model_and_prompts(self):
+        contexts = [{"description": "resume", "content": "my resume"}]
+        key = ContextStore.key(contexts, "gpt-4o-mini", 1)
+        self.assertEqual(key, ContextStore.key(list(contexts), "gpt-4o-mini", 1))
+        self.assertNotEqual(key, ContextStore.key([{"description": "resume", "content": "new resume"}], "gpt-4o-mini", 1))
+        self.assertNotEqual(key, ContextStore.key([{"description": "cv", "content": "my resume"}], "gpt-4o-mini", 1))
+        self.assertNotEqual(key, ContextStore.key(contexts, "gpt-4o", 1))
+        self.assertNotEqual(key, ContextStore.key(contexts, "gpt-4o-mini", 2))
+
+    def test_rerun_only_fills_the_template(self):
+        self.run_engine()
+        # Every posting still needs its tagger and contextifier calls, but nothing is preprocessed again
+        self.assertEqual(self.run_engine({**self.template, "content": "Hello [name]"}), 2 * len(self.variable_contexts))
+        self.assertEqual(self.store.misses, 1 + len(self.variable_contexts))
+
+    def test_only_changed_sources_are_preprocessed(self):
+        self.run_engine()
+        hits = self.store.hits
+        self.write("job0.txt", "an updated job posting")
+        self.run_engine()
+        # The fixed contexts and the unchanged postings are loaded, only the updated posting is preprocessed
+        self.assertEqual(self.store.hits - hits, 1 + len(self.variable_contexts) - 1)
+        self.assertEqual(self.store.misses, 1 + len(self.variable_contexts) + 1)
+
+if __name__ == "__main__":
+    unittest.main()
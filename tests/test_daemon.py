@@ -0,0 +1,135 @@
+import unittest
+import asyncio
+import os
+import sys
+import socket as pysocket
+import threading
+import time
+from unittest import mock
+# Get the absolute path of the project's root directory
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Add the 'src' directory to the Python path
+src_dir = os.path.join(project_root, 'src')
+sys.path.append(src_dir)
+import daemon
+from contexts import PARSERS
+from engine import Engine
+from ihcl import run_submitted_job
+from fake_model import FakeChatModel
+from fixtures import TempDirTestCase
+
+class TestDaemon(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.socket = self.path("ihcl.sock")
+        self.model = FakeChatModel()
+        self.engine = Engine(self.model)
+        self.jobs = 0
+
+        async def handle_job(job, send):
+            self.jobs += 1
+            await run_submitted_job(self.engine, job, send)
+
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.create_task(daemon.serve(self.socket, handle_job))
+        threading.Thread(target = self.loop.run_forever, daemon = True).start()
+        while not os.path.exists(self.socket):
+            time.sleep(0.01)
+
+        self.contextf = self.write("contexts.yaml", "\n".join([
+            "fixed_contexts:",
+            f"  - {{description: resume, path: {self.write('resume.txt', 'my resume')}}}",
+            "variable_contexts:",
+            f"  - - {{description: job, path: {self.write('job0.txt', 'first posting')}}}",
+            f"  - - {{description: job, path: {self.write('job1.txt', 'second posting')}}}",
+        ]))
+        self.templatef = self.write("template.txt", "Dear [company]")
+
+    def tearDown(self):
+        async def stop():
+            self.server.cancel()
+            await asyncio.gather(self.server, return_exceptions = True)
+        asyncio.run_coroutine_threadsafe(stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.engine.close()
+        super().tearDown()
+
+    def job(self, output_dir):
+        return {"contextf": self.contextf, "templatef": self.templatef, "bracket": ["[", "]"], "output_dir": output_dir}
+
+    def test_jobs_share_the_warm_engine(self):
+        for i in range(2):
+            events = []
+            output_dir = self.path(f"output{i}")
+            last = daemon.submit(self.socket, self.job(output_dir), events.append)
+
+            self.assertEqual(last, {"event": "done", "failures": 0})
+            self.assertEqual(sorted(event["name"] for event in events if event["event"] == "result"), ["0", "1"])
+            self.assertEqual(len(os.listdir(output_dir)), 2)
+        self.assertEqual(self.jobs, 2)
+
+    def test_relative_context_paths_are_resolved_against_the_client(self):
+        # The server runs in this process' working directory, the client "ran" from the temporary directory
+        contextf = self.write("relative.yaml", "\n".join([
+            "fixed_contexts:",
+            "  - {description: resume, path: resume.txt}",
+            "variable_contexts:",
+            "  - - {description: job, path: job0.txt}",
+        ]))
+        job = self.job(self.path("output")) | {"contextf": contextf, "cwd": self.tmpdir.name}
+        events = []
+        last = daemon.submit(self.socket, job, events.append)
+        self.assertEqual(last, {"event": "done", "failures": 0})
+        self.assertEqual([event["name"] for event in events if event["event"] == "result"], ["0"])
+
+    def test_jobs_asking_for_another_preprocess_profile_are_rejected(self):
+        with open(self.contextf, "a") as f:
+            f.write("\npreprocess: fast\n")
+        last = daemon.submit(self.socket, self.job(self.path("output")), lambda event: None)
+        self.assertEqual(last["event"], "error")
+        self.assertIn("ihcl serve --preprocess fast", last["message"])
+        self.assertEqual(self.jobs, 1)
+
+    def test_bad_jobs_report_an_error(self):
+        last = daemon.submit(self.socket, {"contextf": "missing.yaml"}, lambda event: None)
+        self.assertEqual(last["event"], "error")
+
+    def test_live_socket_is_not_taken_over(self):
+        with self.assertRaises(RuntimeError):
+            asyncio.run(daemon.serve(self.socket, lambda job, send: None))
+        # The running server still answers on its socket
+        self.assertEqual(daemon.submit(self.socket, self.job(self.path("output")), lambda event: None)["event"], "done")
+
+    def test_stale_socket_is_replaced(self):
+        stale = self.path("stale.sock")
+        with pysocket.socket(pysocket.AF_UNIX) as sock:
+            sock.bind(stale)
+
+        async def serve_once():
+            server = asyncio.ensure_future(daemon.serve(stale, lambda job, send: None))
+            try:
+                for _ in range(100):
+                    try:
+                        _, writer = await asyncio.open_unix_connection(stale)
+                        writer.close()
+                        return True
+                    except ConnectionRefusedError:
+                        await asyncio.sleep(0.01)
+                return False
+            finally:
+                server.cancel()
+                await asyncio.gather(server, return_exceptions = True)
+
+        self.assertTrue(asyncio.run(serve_once()))
+
+    def test_parsed_contexts_stay_warm_between_jobs(self):
+        parse = mock.Mock(side_effect = lambda fname: open(fname).read())
+        with mock.patch.dict(PARSERS, {"txt": parse}):
+            for i in range(2):
+                daemon.submit(self.socket, self.job(self.path(f"output{i}")), lambda event: None)
+        # The template, the resume and both postings are parsed by the first job only
+        self.assertEqual(parse.call_count, 4)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+import asyncio
+import json
+import os
+import sys
+# Get the absolute path of the project's root directory
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Add the 'src' directory to the Python path
+src_dir = os.path.join(project_root, 'src')
+sys.path.append(src_dir)
+from dedup import Deduplicator, MinHasher, shingles, similarity
+from engine import Engine
+from runlog import RunLog
+from fake_model import FakeChatModel
+from fixtures import TempDirTestCase
+
+RESUME = "\n\n".join([
+    "Jane Doe, software engineer with eight years of experience building distributed systems and data pipelines.",
+    "Led a team of five engineers to migrate the billing platform from a monolith to services running on Kubernetes.",
+    "Designed and implemented a streaming ingestion pipeline processing two billion events per day with Kafka and Flink.",
+    "Skills",
+    "Python, Go, Rust, SQL, Kubernetes, Terraform, AWS and a strong interest in developer tooling and observability."
+])
+
+def context(description, content):
+    return {"description": description, "content": content}
+
+class TestDeduplicator(unittest.TestCase):
+    def test_signatures_estimate_jaccard_similarity(self):
+        hasher = MinHasher()
+        a = shingles(RESUME)
+        b = shingles(RESUME.replace("eight years", "nine years"))
+        self.assertEqual(similarity(hasher.signature(a), hasher.signature(a)), 1.0)
+        jaccard = len(a & b) / len(a | b)
+        self.assertAlmostEqual(similarity(hasher.signature(a), hasher.signature(b)), jaccard, delta = 0.15)
+
+    def test_near_duplicate_contexts_are_dropped(self):
+        dedup = Deduplicator()
+        contexts = [
+            context("resume", RESUME),
+            context("resume v2", RESUME.replace("Jane Doe,", "Jane Doe -")),
+            context("cover letter notes", "I am excited about the mission and want to work on compilers and language tooling at scale.")
+        ]
+        kept, removals = dedup.dedup(contexts)
+        self.assertEqual([c["description"] for c in kept], ["resume", "cover letter notes"])
+        self.assertEqual([(r["description"], r["similar_to"]) for r in removals], [("resume v2", "resume")])
+        self.assertGreaterEqual(removals[0]["similarity"], dedup.threshold)
+        self.assertEqual(dedup.removed_contexts, 1)
+        self.assertGreater(dedup.tokens_saved, 0)
+
+    def test_duplicated_paragraphs_are_dropped_from_later_contexts(self):
+        dedup = Deduplicator()
+        paragraphs = RESUME.split("\n\n")
+        posting = "\n\n".join([
+            "Acme Corp is hiring a staff engineer to own the reliability of its payments infrastructure end to end.",
+            paragraphs[1],
+            "Skills"
+        ])
+        kept, removals = dedup.dedup([context("job posting", posting)], reference = [context("resume", RESUME)])
+        self.assertEqual(len(kept), 1)
+        self.assertNotIn(paragraphs[1], kept[0]["content"])
+        # Short paragraphs such as headings are never dropped
+        self.assertIn("Skills", kept[0]["content"])
+        self.assertIn("Acme Corp", kept[0]["content"])
+        self.assertEqual(dedup.removed_paragraphs, 1)
+        self.assertEqual([(r["description"], r["paragraphs"]) for r in removals], [("job posting", 1)])
+
+    def test_distinct_contexts_are_untouched(self):
+        dedup = Deduplicator()
+        contexts = [context("resume", RESUME), context("posting", "Acme Corp builds rockets and is hiring engineers who love telemetry.")]
+        self.assertEqual(dedup.dedup(contexts), (contexts, []))
+        self.assertEqual(dedup.removed_contexts + dedup.removed_paragraphs, 0)
+
+class TestEngineDedup(TempDirTestCase):
+    def test_duplicate_resumes_are_preprocessed_once(self):
+        contexts = [
+            {"description": "resume", "path": self.write("resume.txt", RESUME)},
+            {"description": "resume copy", "path": self.write("resume_copy.txt", RESUME + "\n")}
+        ]
+        calls = []
+        for dedup in [None, Deduplicator()]:
+            model = FakeChatModel()
+            engine = Engine(model, preprocess_profile = "fast", dedup = dedup)
+            try:
+                asyncio.run(engine.preprocess_contexts(asyncio.run(engine.parse(contexts)).contexts))
+            finally:
+                engine.close()
+            calls.append(model.calls)
+        self.assertEqual(calls, [2, 1])
+
+    def test_removals_are_written_to_the_run_log(self):
+        contexts = [
+            {"description": "resume", "path": self.write("resume.txt", RESUME)},
+            {"description": "resume copy", "path": self.write("resume_copy.txt", RESUME + "\n")}
+        ]
+        logf = self.path("run.log")
+        engine = Engine(FakeChatModel(), preprocess_profile = "fast", dedup = Deduplicator(), run_log = RunLog(logf))
+        try:
+            asyncio.run(engine.preprocess_contexts(asyncio.run(engine.parse(contexts)).contexts))
+        finally:
+            engine.close()
+        with open(logf) as f:
+            events = [json.loads(line) for line in f]
+        removals = [event for event in events if event["event"] == "deduplicated"]
+        self.assertEqual(len(removals), 1)
+        self.assertEqual(removals[0]["removals"][0]["description"], "resume copy")
+        self.assertEqual(removals[0]["removals"][0]["similar_to"], "resume")
+        self.assertGreater(removals[0]["tokens_saved"], 0)
+
+if __name__ == "__main__":
+    unittest.main()
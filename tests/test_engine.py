@@ -0,0 +1,58 @@
+import unittest
+import asyncio
+import os
+import sys
+# Get the absolute path of the project's root directory
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Add the 'src' directory to the Python path
+src_dir = os.path.join(project_root, 'src')
+sys.path.append(src_dir)
+from engine import Engine
+from fake_model import FakeChatModel
+from fixtures import TempDirTestCase
+
+class TestEngine(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.write_contexts(6)
+
+    def test_run_returns_one_response_per_variable_context(self):
+        engine = Engine(FakeChatModel(), concurrency = 4)
+        responses = asyncio.run(engine.run(self.fixed_contexts, self.variable_contexts, self.template))
+        self.assertEqual(len(responses), len(self.variable_contexts))
+        for response in responses:
+            self.assertIsInstance(response, list)
+
+    def test_concurrency_is_capped_for_the_whole_run(self):
+        model = FakeChatModel(latency = 0.01)
+        engine = Engine(model, concurrency = 2)
+        asyncio.run(engine.run(self.fixed_contexts, self.variable_contexts, self.template))
+        self.assertEqual(model.max_in_flight, 2)
+
+    def test_fast_preprocess_profile_makes_one_call_per_context(self):
+        engine = Engine(FakeChatModel(), preprocess_profile = "fast")
+        parsed = asyncio.run(engine.parse(self.fixed_contexts + self.variable_contexts[0])).contexts
+
+        fast = FakeChatModel()
+        contexts = asyncio.run(Engine(fast, preprocess_profile = "fast").preprocess_contexts(parsed))
+        self.assertEqual(fast.calls, len(parsed))
+        self.assertTrue(all(context.metadata.processed for context in contexts))
+
+        thorough = FakeChatModel()
+        asyncio.run(Engine(thorough).preprocess_contexts(parsed))
+        self.assertGreater(thorough.calls, fast.calls)
+
+    def test_fast_preprocess_profile_chunks_long_contexts(self):
+        long_posting = self.write("long.txt", "\n\n".join(f"Paragraph {i} of a very long job posting with many requirements." for i in range(100)))
+        engine = Engine(FakeChatModel(), preprocess_profile = "fast")
+        parsed = asyncio.run(engine.parse([{"description": "job", "path": long_posting}])).contexts
+
+        fast = FakeChatModel()
+        contexts = asyncio.run(Engine(fast, preprocess_profile = "fast", chunk_tokens = 200).preprocess_contexts(parsed))
+        # The long context is processed in chunks and merged back into one context
+        self.assertGreater(fast.calls, 1)
+        self.assertEqual(len(contexts), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+# Get the absolute path of the project's root directory
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Add the 'src' directory to the Python path
+src_dir = os.path.join(project_root, 'src')
+sys.path.append(src_dir)
+from fetcher import Fetcher, HttpCache, set_fetcher
+from contexts import Context
+
+class Handler(BaseHTTPRequestHandler):
+    etag = '"v1"'
+    body = "<html><body><h1>Software Engineer</h1><p>Acme Corp is hiring.</p></body></html>"
+    full_responses = 0
+    not_modified = 0
+
+    def do_GET(self):
+        if self.headers.get("If-None-Match") == Handler.etag:
+            Handler.not_modified += 1
+            self.send_response(304)
+            self.end_headers()
+            return
+        Handler.full_responses += 1
+        body = Handler.body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", Handler.etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class TestFetcher(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target = cls.server.serve_forever, daemon = True).start()
+        cls.url = "http://127.0.0.1:{}/posting".format(cls.server.server_address[1])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        Handler.full_responses = 0
+        Handler.not_modified = 0
+        Handler.etag = '"v1"'
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_conditional_get(self):
+        fetcher = Fetcher(cache = HttpCache(root = self.tmpdir.name))
+        try:
+            first = fetcher.fetch_text(self.url)
+            second = fetcher.fetch_text(self.url)
+            self.assertIn("Acme Corp is hiring.", first)
+            self.assertEqual(first, second)
+            self.assertEqual((Handler.full_responses, Handler.not_modified), (1, 1))
+
+            # A changed validator means a full download
+            Handler.etag = '"v2"'
+            fetcher.fetch_text(self.url)
+            self.assertEqual(Handler.full_responses, 2)
+        finally:
+            fetcher.close()
+
+    def test_url_contexts_use_shared_fetcher(self):
+        fetcher = Fetcher(cache = HttpCache(root = self.tmpdir.name))
+        set_fetcher(fetcher)
+        context = Context("job posting", self.url)
+        self.assertEqual(context.ftype, "https")
+        self.assertIn("Software Engineer", context.content)
+        self.assertEqual(fetcher.requests, 1)
+        fetcher.close()
+
+if __name__ == "__main__":
+    unittest.main()
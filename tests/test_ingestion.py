@@ -0,0 +1,94 @@
+import unittest
+import asyncio
+import os
+import sys
+import threading
+import time
+from unittest import mock
+# Get the absolute path of the project's root directory
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Add the 'src' directory to the Python path
+src_dir = os.path.join(project_root, 'src')
+sys.path.append(src_dir)
+from contexts import Ingestion, PARSERS
+from engine import Engine
+from fake_model import FakeChatModel
+from fixtures import TempDirTestCase
+
+# Counts the parses of every path, and parses paths containing "slow" slowly
+class CountingParser:
+    def __init__(self, delay = 0.5):
+        self.delay = delay
+        self.parsed = []
+        self.started = []
+        self.slow_done = None
+        self.lock = threading.Lock()
+
+    def __call__(self, fname):
+        with self.lock:
+            self.started.append(time.perf_counter())
+        if "slow" in fname:
+            time.sleep(self.delay)
+            self.slow_done = time.perf_counter()
+        with self.lock:
+            self.parsed.append(fname)
+        with open(fname) as f:
+            return f.read()
+
+class TestIngestion(TempDirTestCase):
+    def test_shared_paths_are_parsed_once(self):
+        company = self.write("company.txt", "about the company")
+        parser = CountingParser()
+
+        async def ingest():
+            ingestion = Ingestion()
+            first = await ingestion.contexts([{"description": "job", "path": self.write("job0.txt", "job 0")}, {"description": "company", "path": company}])
+            second = await ingestion.contexts([{"description": "about us", "path": company}])
+            await ingestion.close()
+            return first, second
+
+        with mock.patch.dict(PARSERS, {"txt": parser}):
+            first, second = asyncio.run(ingest())
+        self.assertEqual(sorted(parser.parsed), sorted([company, self.path("job0.txt")]))
+        self.assertEqual(second.contexts[0].description, "about us")
+        self.assertEqual(second.contexts[0].content, "about the company")
+        self.assertEqual(first.contexts[1].description, "company")
+
+    def test_parsing_overlaps_with_llm_work(self):
+        fixed_contexts = [{"description": "resume", "path": self.write("resume.txt", "my resume")}]
+        variable_contexts = [
+            [{"description": "job", "path": self.write("job_fast.txt", "fast job posting")}],
+            [{"description": "job", "path": self.write("job_slow.txt", "slow job posting")}]
+        ]
+        parser = CountingParser(delay = 0.5)
+        finished = {}
+        engine = Engine(FakeChatModel(latency = 0.2))
+        try:
+            with mock.patch.dict(PARSERS, {"txt": parser}):
+                start = time.perf_counter()
+                responses = asyncio.run(engine.run(fixed_contexts, variable_contexts, self.template,
+                                                   on_result = lambda pid, response: finished.setdefault(pid, time.perf_counter())))
+        finally:
+            engine.close()
+        self.assertTrue(all(isinstance(response, list) for response in responses))
+        # Every posting is parsed while the fixed contexts are preprocessed, before the first LLM call even returns
+        self.assertLess(max(parser.started) - start, 0.2)
+        self.assertLess(parser.slow_done, min(finished.values()))
+
+    def test_failed_parse_only_fails_its_posting(self):
+        fixed_contexts = [{"description": "resume", "path": self.write("resume.txt", "my resume")}]
+        variable_contexts = [
+            [{"description": "job", "path": self.write("job.txt", "job posting")}],
+            [{"description": "job", "path": self.path("missing.txt")}]
+        ]
+        engine = Engine(FakeChatModel())
+        try:
+            responses = asyncio.run(engine.run(fixed_contexts, variable_contexts, self.template))
+        finally:
+            engine.close()
+        self.assertIsInstance(responses[0], list)
+        self.assertIsInstance(responses[1], FileNotFoundError)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+import asyncio
+import os
+import sys
+import time
+from typing import List
+from pydantic import BaseModel, Field
+from langchain_core.messages import SystemMessage, HumanMessage
+# Get the absolute path of the project's root directory
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Add the 'src' directory to the Python path
+src_dir = os.path.join(project_root, 'src')
+sys.path.append(src_dir)
+from llmcache import LLMCache, CachedChatModel
+
+class Answer(BaseModel):
+    answers: List[str] = Field(description = "Answers")
+
+class CountingModel:
+    model_name = "counting"
+
+    def __init__(self):
+        self.calls = 0
+
+    def with_structured_output(self, schema, **kwargs):
+        model = self
+        class Runnable:
+            def invoke(self, messages):
+                model.calls += 1
+                return schema(answers = [messages[-1].content])
+
+            async def ainvoke(self, messages):
+                return self.invoke(messages)
+        return Runnable()
+
+class TestLLMCache(unittest.TestCase):
+    def setUp(self):
+        self.model = CountingModel()
+        self.cache = LLMCache(path = ":memory:")
+        self.cached = CachedChatModel(self.model, self.cache, prompt_version = 1)
+        self.messages = [SystemMessage(content = "system"), HumanMessage(content = "hello")]
+
+    def test_hit_after_miss(self):
+        r1 = self.cached.with_structured_output(Answer).invoke(self.messages)
+        r2 = self.cached.with_structured_output(Answer).invoke(self.messages)
+        r3 = asyncio.run(self.cached.with_structured_output(Answer).ainvoke(self.messages))
+        self.assertEqual(r1, r2)
+        self.assertEqual(r1, r3)
+        self.assertEqual(self.model.calls, 1)
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 1))
+        self.assertAlmostEqual(self.cache.hit_rate(), 2 / 3)
+
+    def test_key_includes_messages_and_prompt_version(self):
+        self.cached.with_structured_output(Answer).invoke(self.messages)
+        self.cached.with_structured_output(Answer).invoke(self.messages[:1] + [HumanMessage(content = "bye")])
+        CachedChatModel(self.model, self.cache, prompt_version = 2).with_structured_output(Answer).invoke(self.messages)
+        self.assertEqual(self.model.calls, 3)
+
+    def test_ttl(self):
+        cache = LLMCache(path = ":memory:", ttl = 0)
+        cache.put("k", "v")
+        time.sleep(0.01)
+        self.assertEqual(cache.get("k"), None)
+
+    def test_lru_eviction(self):
+        cache = LLMCache(path = ":memory:", max_entries = 2)
+        cache.put("a", "1")
+        time.sleep(0.01)
+        cache.put("b", "2")
+        time.sleep(0.01)
+        cache.get("a")
+        time.sleep(0.01)
+        cache.put("c", "3")
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get("b"), None)
+        self.assertEqual(cache.get("a"), "1")
+
+if __name__ == "__main__":
+    unittest.main()
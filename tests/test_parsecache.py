@@ -0,0 +1,64 @@
+import unittest
+import os
+import sys
+import tempfile
+from unittest import mock
+# Get the absolute path of the project's root directory
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Add the 'src' directory to the Python path
+src_dir = os.path.join(project_root, 'src')
+sys.path.append(src_dir)
+from contexts import Context, Contexts, ContextParser, PARSERS
+from parsecache import ParseCache
+
+class TestParseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = ParseCache(root = os.path.join(self.tmpdir.name, "cache"))
+        self.fname = os.path.join(self.tmpdir.name, "resume.txt")
+        with open(self.fname, "w") as f:
+            f.write("line one\nline two\n")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_context_uses_cache(self):
+        c1 = Context("resume", self.fname, cache = self.cache)
+        with mock.patch.dict(PARSERS, {"txt": mock.Mock(side_effect = AssertionError("parsed twice"))}):
+            c2 = Context("resume", self.fname, cache = self.cache)
+        self.assertEqual(c1.content, c2.content)
+
+    def test_key_changes_with_content(self):
+        k1 = self.cache.key("txt", self.fname)
+        with open(self.fname, "a") as f:
+            f.write("line three\n")
+        k2 = self.cache.key("txt", self.fname)
+        self.assertNotEqual(k1, k2)
+        self.assertNotEqual(k2, self.cache.key("pdf", self.fname))
+
+    def test_eviction_is_least_recently_used(self):
+        cache = ParseCache(root = os.path.join(self.tmpdir.name, "small"), max_bytes = 25)
+        cache.put("a", "a" * 10)
+        cache.put("b", "b" * 10)
+        os.utime(cache.entry_path("a"), (0, 0))
+        os.utime(cache.entry_path("b"), (1, 1))
+        cache.get("a")
+        cache.put("c", "c" * 10)
+        self.assertEqual(cache.get("b"), None)
+        self.assertEqual(cache.get("a"), "a" * 10)
+        self.assertEqual(cache.get("c"), "c" * 10)
+
+    def test_clear(self):
+        Context("resume", self.fname, cache = self.cache)
+        self.assertGreater(self.cache.size(), 0)
+        self.cache.clear()
+        self.assertEqual(self.cache.size(), 0)
+
+    def test_contexts_deduplicates_paths(self):
+        contexts = Contexts([{"description": "resume", "path": self.fname}, {"description": "resume", "path": self.fname}], cache = self.cache)
+        self.assertEqual(len(contexts.contexts), 2)
+        self.assertIs(contexts.contexts[0], contexts.contexts[1])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+import os
+import sys
+import tempfile
+# Get the absolute path of the project's root directory
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Add the 'src' directory to the Python path
+src_dir = os.path.join(project_root, 'src')
+sys.path.append(src_dir)
+from contexts import Context, Contexts, ContextParser, ParseEngine
+from fixtures import write_pdf, write_docx, write_txt
+
+class TestParseEngine(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.engine = ParseEngine(max_workers = 2, pages_per_shard = 3)
+        self.pages = [f"page number {i}" for i in range(10)]
+        self.pdf = write_pdf(os.path.join(self.tmpdir.name, "portfolio.pdf"), self.pages)
+        self.docx = write_docx(os.path.join(self.tmpdir.name, "resume.docx"), ["first", "second"])
+        self.txt = write_txt(os.path.join(self.tmpdir.name, "notes.txt"), ["some notes"])
+
+    def tearDown(self):
+        self.engine.close()
+        self.tmpdir.cleanup()
+
+    def test_sharded_pdf_keeps_page_order(self):
+        self.assertEqual(self.engine.parse("pdf", self.pdf), "\n".join(self.pages))
+        self.assertEqual(self.engine.parse("pdf", self.pdf), ContextParser("pdf").parse(self.pdf))
+
+    def test_matches_in_process_parsers(self):
+        for ftype, fname in [("docx", self.docx), ("txt", self.txt)]:
+            self.assertEqual(self.engine.parse(ftype, fname), ContextParser(ftype).parse(fname))
+
+    def test_contexts_use_engine(self):
+        contexts = Contexts([
+            {"description": "portfolio", "path": self.pdf},
+            {"description": "resume", "path": self.docx}
+        ], engine = self.engine)
+        self.assertEqual([c.content for c in contexts.contexts], ["\n".join(self.pages), "first\nsecond"])
+
+if __name__ == "__main__":
+    unittest.main()
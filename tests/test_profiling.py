@@ -0,0 +1,74 @@
+import unittest
+import asyncio
+import json
+import os
+import sys
+# Get the absolute path of the project's root directory
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Add the 'src' directory to the Python path
+src_dir = os.path.join(project_root, 'src')
+sys.path.append(src_dir)
+from engine import Engine
+from profiling import Profiler, set_profiler, estimate_cost
+from scheduler import Scheduler
+from fake_model import FakeChatModel
+from fixtures import TempDirTestCase
+
+class TestProfiling(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.profiler = Profiler()
+        set_profiler(self.profiler)
+        self.write_contexts(3)
+
+    def tearDown(self):
+        set_profiler(None)
+        super().tearDown()
+
+    def run_engine(self):
+        engine = Engine(FakeChatModel(latency = 0.01), concurrency = 2, scheduler = Scheduler())
+        try:
+            return asyncio.run(engine.run(self.fixed_contexts, self.variable_contexts, self.template))
+        finally:
+            engine.close()
+
+    def test_records_nodes_model_calls_and_parses(self):
+        self.run_engine()
+        summary = {(entry["kind"], entry["name"]): entry for entry in self.profiler.summary()}
+
+        for node in ["preprocess.cleaner", "preprocess.categorizer", "preprocess.summarizer", "contextifier.preprocessor", "contextifier.contextifier"]:
+            self.assertIn(("node", node), summary)
+        # Model calls are attributed to the node that made them
+        self.assertEqual(summary[("llm", "contextifier.contextifier")]["count"], len(self.variable_contexts))
+        self.assertGreater(summary[("llm", "preprocess.cleaner")]["prompt_tokens_total"], 0)
+        self.assertGreater(summary[("llm", "preprocess.cleaner")]["completion_tokens_total"], 0)
+        # Three postings share two model slots, so some calls queue
+        self.assertGreater(sum(entry.get("queue_wait_total", 0) for entry in summary.values()), 0)
+        self.assertEqual(summary[("parse", "txt")]["count"], 1 + len(self.variable_contexts))
+
+    def test_exports_json_and_prometheus(self):
+        self.run_engine()
+        fname = self.path("profile.json")
+        self.profiler.export(fname)
+
+        with open(fname) as f:
+            report = json.load(f)
+        self.assertEqual(len(report["records"]), len(self.profiler.records))
+        with open(self.path("profile.prom")) as f:
+            metrics = f.read()
+        self.assertIn('ihcl_duration_seconds{kind="node",name="preprocess.cleaner",quantile="0.95"}', metrics)
+        self.assertIn('ihcl_prompt_tokens_total{kind="llm",name="preprocess.cleaner"}', metrics)
+
+    def test_nothing_is_recorded_without_a_profiler(self):
+        set_profiler(None)
+        self.run_engine()
+        self.assertEqual(self.profiler.records, [])
+
+    def test_estimate_cost(self):
+        self.assertAlmostEqual(estimate_cost("gpt-4o-mini", 1_000_000, 1_000_000), 0.75)
+        self.assertAlmostEqual(estimate_cost("gpt-4o-2024-08-06", 1_000_000, 0), 2.50)
+        self.assertEqual(estimate_cost("fake", 1000, 1000), 0.0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+import asyncio
+import os
+import sys
+from unittest import mock
+# Get the absolute path of the project's root directory
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Add the 'src' directory to the Python path
+src_dir = os.path.join(project_root, 'src')
+sys.path.append(src_dir)
+from preprocess import Context
+from retrieval import RelevanceIndex
+from engine import Engine
+from fake_model import FakeChatModel
+from fixtures import TempDirTestCase
+import retrieval
+
+def context(description, content):
+    return Context(description = description, content = content, metadata = {"processed": True})
+
+class TestRelevanceIndex(unittest.TestCase):
+    def setUp(self):
+        self.contexts = [
+            context("resume", "Built a distributed database in Rust.\n\nLed a team of five engineers.\n\nEnjoys hiking on weekends."),
+            context("job posting", "Acme Corp is hiring a database engineer.\n\nBenefits include free lunch.")
+        ]
+        self.index = RelevanceIndex(self.contexts, passage_tokens = 12)
+
+    def test_search_ranks_relevant_passages_first(self):
+        top = self.index.search("database", 2)
+        self.assertEqual(len(top), 2)
+        for pid in top:
+            self.assertIn("database", self.index.passages[pid][1])
+
+    def test_unknown_terms_match_nothing(self):
+        self.assertEqual(self.index.search("quantum", 3), [])
+
+    def test_top_contexts_groups_passages(self):
+        relevant = self.index.top_contexts(["company name", "Acme"], 1)
+        self.assertEqual([c.description for c in relevant], ["job posting"])
+        self.assertIn("Acme", relevant[0].content)
+        self.assertNotIn("lunch", relevant[0].content)
+
+    def test_extended_index_scores_like_a_full_index(self):
+        posting = [context("company", "Acme Corp builds databases.\n\nThe office is in Berlin.")]
+        extended = self.index.extended(posting)
+        full = RelevanceIndex(self.contexts + posting, passage_tokens = 12)
+        self.assertEqual(extended.passages, full.passages)
+        for query in ["database", "Acme Berlin", "quantum"]:
+            self.assertEqual(extended.scores(query).round(5).tolist(), full.scores(query).round(5).tolist())
+        self.assertEqual(extended.top_contexts(["Berlin"], 1), full.top_contexts(["Berlin"], 1))
+        # The base index is unchanged
+        self.assertEqual(len(self.index.contexts), 2)
+
+class TestRunRetrieval(TempDirTestCase):
+    def test_fixed_contexts_are_indexed_once_per_run(self):
+        self.write_contexts(4)
+        split_tokens = mock.Mock(side_effect = retrieval.split_tokens)
+        engine = Engine(FakeChatModel(), top_k = 2)
+        try:
+            with mock.patch.object(retrieval, "split_tokens", split_tokens):
+                responses = asyncio.run(engine.run(self.fixed_contexts, self.variable_contexts, self.template))
+        finally:
+            engine.close()
+        self.assertTrue(all(isinstance(response, list) for response in responses))
+        # The resume once, then only each posting's own context
+        self.assertEqual(split_tokens.call_count, 1 + 4)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+import asyncio
+import os
+import sys
+import time
+# Get the absolute path of the project's root directory
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Add the 'src' directory to the Python path
+src_dir = os.path.join(project_root, 'src')
+sys.path.append(src_dir)
+from engine import Engine
+from router import ModelRouter, load_router
+from contextstore import ContextStore
+from llmcache import LLMCache, CachedChatModel
+from profiling import current_node
+from fake_model import FakeChatModel
+from pydantic import BaseModel
+from langchain_core.messages import HumanMessage
+from fixtures import TempDirTestCase
+
+def fake(model_name, latency = 0.0):
+    model = FakeChatModel(latency = latency)
+    model.model_name = model_name
+    return model
+
+class TestRouter(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.write_contexts(4)
+
+    def test_routes_by_node_then_graph(self):
+        router = ModelRouter({"large": fake("large"), "local": fake("local")}, routes = {"preprocess": "local", "contextifier.tagger": "local"}, default = "large")
+        self.assertEqual(router.name_for("preprocess.cleaner"), "local")
+        self.assertEqual(router.name_for("contextifier.tagger"), "local")
+        self.assertEqual(router.name_for("contextifier.contextifier"), "large")
+        self.assertEqual(router.name_for(None), "large")
+        self.assertEqual(router.routes_for("preprocess"), {"default": "large", "preprocess": "local"})
+
+    def test_nodes_are_served_by_their_routed_models(self):
+        large, local = fake("large"), fake("local", latency = 0.01)
+        router = load_router({
+            "default": "large",
+            "models": {"large": {"model": large}, "local": {"model": local, "concurrency": 1}},
+            "routes": {"preprocess": "local"}
+        }, lambda model: model)
+        engine = Engine(router, concurrency = 8)
+        try:
+            responses = asyncio.run(engine.run(self.fixed_contexts, self.variable_contexts, self.template))
+        finally:
+            engine.close()
+        self.assertTrue(all(isinstance(response, list) for response in responses))
+
+        # Preprocessing (3 calls for the fixed contexts, 3 per posting) goes to the local model, one call at a time,
+        # while the tagger and contextifier calls of every posting go to the large model
+        self.assertEqual(local.calls, 3 * (1 + len(self.variable_contexts)))
+        self.assertEqual(local.max_in_flight, 1)
+        self.assertEqual(large.calls, 2 * len(self.variable_contexts))
+
+    def test_saturated_route_does_not_delay_other_models(self):
+        class Answer(BaseModel):
+            answer: str
+
+        router = ModelRouter({"large": fake("large"), "local": fake("local", latency = 0.2)}, routes = {"preprocess": "local"},
+                             default = "large", concurrency = {"local": 1})
+        engine = Engine(router, concurrency = 2)
+
+        async def call(node):
+            current_node.set(node)
+            start = time.perf_counter()
+            await engine.model.with_structured_output(Answer).ainvoke([HumanMessage(content = "question")])
+            return time.perf_counter() - start
+
+        async def run():
+            queued = [asyncio.ensure_future(call(f"preprocess.{node}")) for node in ["cleaner", "categorizer", "summarizer", "processor"]]
+            await asyncio.sleep(0)
+            wall = await call("contextifier.contextifier")
+            await asyncio.gather(*queued)
+            return wall
+
+        try:
+            # The local calls queue on their own cap without holding a global slot, so the large model is free
+            self.assertLess(asyncio.run(run()), 0.1)
+        finally:
+            engine.close()
+
+    def test_store_key_names_the_routed_models(self):
+        store = ContextStore(root = self.path("store"))
+        for routes, misses in [({"preprocess": "local"}, 1), ({"preprocess": "local"}, 1), ({}, 2)]:
+            router = ModelRouter({"large": fake("large"), "local": fake("local")}, routes = routes, default = "large")
+            engine = Engine(router, store = store)
+            asyncio.run(engine.preprocess_contexts(asyncio.run(engine.parse(self.fixed_contexts)).contexts))
+            engine.close()
+            self.assertEqual(store.misses, misses)
+
+    def test_store_key_sees_through_the_llm_cache(self):
+        store = ContextStore(root = self.path("store"))
+        llm_cache = LLMCache(path = self.path("llm.sqlite"))
+        for local, misses in [("llama-a", 1), ("llama-a", 1), ("llama-b", 2)]:
+            router = ModelRouter({"large": fake("large"), "local": fake(local)}, routes = {"preprocess": "local"}, default = "large")
+            engine = Engine(router, store = store, wrap = lambda m: CachedChatModel(m, llm_cache, prompt_version = 1))
+            asyncio.run(engine.preprocess_contexts(asyncio.run(engine.parse(self.fixed_contexts)).contexts))
+            engine.close()
+            self.assertEqual(store.misses, misses)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+import asyncio
+import json
+import os
+import sys
+import threading
+# Get the absolute path of the project's root directory
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Add the 'src' directory to the Python path
+src_dir = os.path.join(project_root, 'src')
+sys.path.append(src_dir)
+from runlog import RunLog
+from engine import Engine
+from fake_model import FakeChatModel
+from fixtures import TempDirTestCase
+
+def read_events(fname):
+    with open(fname) as f:
+        return [json.loads(line) for line in f]
+
+class TestRunLog(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.fname = self.path("run.log")
+
+    def test_events_from_many_threads_are_whole_lines(self):
+        run_log = RunLog(self.fname)
+        def log(i):
+            for j in range(200):
+                run_log.log("event", thread = i, j = j)
+        threads = [threading.Thread(target = log, args = (i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        run_log.close()
+        events = read_events(self.fname)
+        self.assertEqual(len(events), 8 * 200)
+        self.assertEqual(run_log.events, 8 * 200)
+        for i in range(8):
+            self.assertEqual([e["j"] for e in events if e["thread"] == i], list(range(200)))
+
+    def test_long_content_is_truncated_or_hashed(self):
+        content = "x" * 1000
+        for mode, check in [("truncate", lambda v: v.startswith("x" * 10) and "+900 chars" in v), ("hash", lambda v: v.startswith("sha256:")), ("full", lambda v: v == content)]:
+            run_log = RunLog(self.fname, content = mode, max_chars = 100)
+            run_log.log("event", content = content, short = "kept")
+            run_log.close()
+            event = read_events(self.fname)[0]
+            self.assertTrue(check(event["content"]), mode)
+            self.assertEqual(event["short"], "kept")
+
+    def test_rotates_by_size(self):
+        run_log = RunLog(self.fname, max_bytes = 2000, backups = 2, batch_size = 1)
+        for i in range(100):
+            run_log.log("event", i = i, padding = "p" * 50)
+        run_log.close()
+        self.assertTrue(os.path.exists(self.fname + ".1"))
+        self.assertTrue(os.path.exists(self.fname + ".2"))
+        self.assertFalse(os.path.exists(self.fname + ".3"))
+        for fname in [self.fname, self.fname + ".1"]:
+            self.assertLessEqual(os.path.getsize(fname), 2000)
+        # The current file holds the latest events
+        self.assertEqual(read_events(self.fname)[-1]["i"], 99)
+
+    def test_engine_logs_nodes_of_the_run(self):
+        self.write_contexts(1)
+        engine = Engine(FakeChatModel(), run_log = RunLog(self.fname))
+        try:
+            asyncio.run(engine.run(self.fixed_contexts, self.variable_contexts, self.template))
+        finally:
+            engine.close()
+        events = read_events(self.fname)
+        self.assertEqual(len({event["run"] for event in events}), 1)
+        nodes = {event["node"] for event in events}
+        self.assertIn("preprocess.cleaner", nodes)
+        self.assertIn("contextifier.contextifier", nodes)
+        posting = [event for event in events if event["event"] == "posting"]
+        self.assertEqual(len(posting), 1)
+        self.assertGreater(posting[0]["wall"], 0)
+
+if __name__ == "__main__":
+    unittest.main()
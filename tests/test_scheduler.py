@@ -0,0 +1,79 @@
+import unittest
+import asyncio
+import os
+import sys
+import time
+# Get the absolute path of the project's root directory
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Add the 'src' directory to the Python path
+src_dir = os.path.join(project_root, 'src')
+sys.path.append(src_dir)
+import scheduler
+from scheduler import Scheduler
+
+class RateLimitError(Exception):
+    status_code = 429
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.window = scheduler.WINDOW
+        scheduler.WINDOW = 0.2
+
+    def tearDown(self):
+        scheduler.WINDOW = self.window
+
+    def test_rpm_budget(self):
+        s = Scheduler(rpm = 2, completion_tokens = 0)
+        async def run():
+            start = time.monotonic()
+            await asyncio.gather(*[s.acquire(1) for _ in range(3)])
+            return time.monotonic() - start
+        elapsed = asyncio.run(run())
+        self.assertGreaterEqual(elapsed, 0.15)
+        self.assertEqual(s.admitted, 3)
+        self.assertEqual(s.max_queue_depth, 1)
+        self.assertEqual(s.queue_depth, 0)
+        self.assertGreater(s.mean_wait(), 0)
+
+    def test_tpm_budget(self):
+        s = Scheduler(tpm = 100, completion_tokens = 0)
+        async def run():
+            await s.acquire(60)
+            return await s.acquire(60)
+        self.assertGreaterEqual(asyncio.run(run()), 0.15)
+
+    def test_oversized_call_is_admitted(self):
+        s = Scheduler(tpm = 10, completion_tokens = 0)
+        asyncio.run(s.acquire(50))
+        self.assertEqual(s.admitted, 1)
+
+    def test_retries_rate_limits(self):
+        s = Scheduler(max_retries = 3, base_delay = 0.001)
+        attempts = []
+        async def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise RateLimitError()
+            return "ok"
+        self.assertEqual(asyncio.run(s.call(flaky, 1)), "ok")
+        self.assertEqual(s.retries, 2)
+
+    def test_does_not_retry_other_errors(self):
+        s = Scheduler(max_retries = 3, base_delay = 0.001)
+        async def broken():
+            raise ValueError()
+        with self.assertRaises(ValueError):
+            asyncio.run(s.call(broken, 1))
+        self.assertEqual(s.retries, 0)
+
+    def test_timeout_is_retried(self):
+        s = Scheduler(max_retries = 1, base_delay = 0.001, timeout = 0.01)
+        async def slow():
+            await asyncio.sleep(1)
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(s.call(slow, 1))
+        self.assertEqual(s.retries, 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+import os
+import sys
+# Get the absolute path of the project's root directory
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Add the 'src' directory to the Python path
+src_dir = os.path.join(project_root, 'src')
+sys.path.append(src_dir)
+from preprocess import Context, ContextMetadata
+from serialize import normalize, serialize_context, serialize_contexts, serialize_descriptions
+from tokens import count_tokens
+
+RESUME = """Jane Doe   \t Software Engineer\r\n\r\n\r\n
+Experience:  Built   data pipelines at   Acme  .\n\n\n\n
+Skills: Python, SQL,\tDistributed systems
+"""
+
+POSTING = """About   us\n\nWe are Initech, we build   payment software.\n\n\n
+The role:  Backend engineer working on\tpayments.\n\nBenefits: remote work
+"""
+
+def context(description, content, processed = False):
+    return Context(description = description, content = content, metadata = ContextMetadata(processed = processed))
+
+class TestSerialize(unittest.TestCase):
+    def test_normalize(self):
+        self.assertEqual(normalize("a  b\t c \r\n\r\n\r\n\nd \n e"), "a b c\n\nd\ne")
+
+    def test_descriptions_are_headers_and_repeats_are_dropped(self):
+        contexts = [context("resume", "first\n\nshared"), context("resume", "shared\n\nsecond"), context("job posting", "posting")]
+        self.assertEqual(serialize_contexts(contexts), "# resume\nfirst\n\nshared\n\nsecond\n\n# job posting\nposting")
+
+    def test_accepts_dicts_and_empty_content(self):
+        self.assertEqual(serialize_context({"description": "notes", "content": None}), "# notes")
+
+    def test_descriptions_are_numbered(self):
+        self.assertEqual(serialize_descriptions(["resume", "job  posting"]), "1. resume\n2. job posting")
+
+    def test_tokens_saved_per_node(self):
+        resumes = [context("resume", RESUME), context("resume", RESUME.replace("Acme", "Globex"))]
+        contexts = resumes + [context("job posting", POSTING, processed = True)]
+        # The inputs every node formatted with Python reprs before, and with the serializer now
+        prompts = {
+            "cleaner": (f"{resumes[0]}", serialize_context(resumes[0])),
+            "summarizer": (f"{resumes}", serialize_contexts(resumes)),
+            "categorizer": (f"{[c.description for c in contexts]}", serialize_descriptions([c.description for c in contexts])),
+            "tagger": (f"{contexts}", serialize_contexts(contexts)),
+            "contextifier": (f"{contexts}", serialize_contexts(contexts)),
+        }
+
+        print()
+        for node, (before, after) in prompts.items():
+            saved = count_tokens(before) - count_tokens(after)
+            print(f"{node}: {count_tokens(before)} -> {count_tokens(after)} tokens, saved {saved}")
+            if node != "categorizer":
+                self.assertGreater(saved, 0)
+
+if __name__ == "__main__":
+    unittest.main()
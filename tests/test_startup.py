@@ -0,0 +1,71 @@
+import unittest
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+# Get the absolute path of the project's root directory
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Add the 'src' directory to the Python path
+src_dir = os.path.join(project_root, 'src')
+sys.path.append(src_dir)
+from engine import Engine
+from llmcache import LLMCache, CachedChatModel
+from parsecache import ParseCache
+from fake_model import FakeChatModel
+from fixtures import TempDirTestCase
+
+# Budgets are generous multiples of what a laptop takes so that only real regressions (e.g. an eager import of the
+# LLM stack) fail; override them with IHCL_HELP_BUDGET and IHCL_WARM_RUN_BUDGET on slow machines
+HELP_BUDGET = float(os.environ.get("IHCL_HELP_BUDGET", 1.5))
+WARM_RUN_BUDGET = float(os.environ.get("IHCL_WARM_RUN_BUDGET", 1.0))
+
+HEAVY_MODULES = ["langchain_openai", "langchain_core", "langgraph", "openai", "docx", "pypdf", "aiohttp", "html2text", "numpy", "tiktoken", "omegaconf"]
+
+def loaded_modules(code):
+    # Runs `code` in a fresh interpreter and returns which of HEAVY_MODULES it imported
+    script = f"import sys, json\nsys.path.insert(0, {src_dir!r})\n{code}\nprint(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    result = subprocess.run([sys.executable, "-c", script], capture_output = True, text = True, cwd = project_root, check = True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+class TestStartup(TempDirTestCase):
+    def test_help_is_within_budget(self):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(src_dir, "ihcl.py"), "--help"], capture_output = True, cwd = project_root, check = True)
+        self.assertLess(time.perf_counter() - start, HELP_BUDGET)
+
+    def test_cli_does_not_import_heavy_modules(self):
+        self.assertEqual(loaded_modules("import ihcl"), [])
+
+    def test_txt_contexts_do_not_import_other_parsers(self):
+        with tempfile.NamedTemporaryFile("w", suffix = ".txt") as f:
+            f.write("some notes")
+            f.flush()
+            loaded = loaded_modules(f"from contexts import Context\nContext('notes', {f.name!r})")
+        self.assertNotIn("pypdf", loaded)
+        self.assertNotIn("docx", loaded)
+
+    def test_warm_cached_run_is_within_budget(self):
+        self.write_contexts(4)
+
+        llm_cache = LLMCache(path = self.path("llm.sqlite"))
+        def run(model):
+            engine = Engine(model, cache = ParseCache(root = self.path("parse")), wrap = lambda m: CachedChatModel(m, llm_cache, prompt_version = 1))
+            try:
+                return asyncio.run(engine.run(self.fixed_contexts, self.variable_contexts, self.template))
+            finally:
+                engine.close()
+
+        # Every call of the warm run is answered by the caches, so none of the model latency is paid
+        run(FakeChatModel(latency = 0.05))
+        model = FakeChatModel(latency = 0.05)
+        start = time.perf_counter()
+        run(model)
+        self.assertLess(time.perf_counter() - start, WARM_RUN_BUDGET)
+        self.assertEqual(model.calls, 0)
+
+if __name__ == "__main__":
+    unittest.main()
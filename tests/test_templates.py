@@ -0,0 +1,51 @@
+import unittest
+import asyncio
+import os
+import sys
+# Get the absolute path of the project's root directory
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Add the 'src' directory to the Python path
+src_dir = os.path.join(project_root, 'src')
+sys.path.append(src_dir)
+from templates import extract_bracketed, template_key, TemplateAnalysisCache
+
+class TestExtractBracketed(unittest.TestCase):
+    def test_extracts_fields_in_order(self):
+        template = "Dear [hiring manager], I want to work at [company] because [company] [reason]."
+        self.assertEqual(extract_bracketed(template, ("[", "]")), ["hiring manager", "company", "reason"])
+
+    def test_multi_character_and_identical_brackets(self):
+        self.assertEqual(extract_bracketed("Hi {{name}}, {{ role }}", ("{{", "}}")), ["name", "role"])
+        self.assertEqual(extract_bracketed("Hi *name* at *company*", ("*", "*")), ["name", "company"])
+
+    def test_no_fields(self):
+        self.assertEqual(extract_bracketed("Nothing to fill", ("<", ">")), [])
+
+    def test_ambiguous_templates_fall_back(self):
+        self.assertEqual(extract_bracketed("Hi <a <b> c>", ("<", ">")), None)
+        self.assertEqual(extract_bracketed("Hi <name", ("<", ">")), None)
+        self.assertEqual(extract_bracketed("Hi name> <x>", ("<", ">")), None)
+        self.assertEqual(extract_bracketed("Hi *name", ("*", "*")), None)
+
+class TestTemplateAnalysisCache(unittest.TestCase):
+    def test_concurrent_callers_share_one_computation(self):
+        cache = TemplateAnalysisCache()
+        calls = []
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return ["name"]
+        async def run():
+            key = template_key("Hi [name]", ("[", "]"))
+            results = await asyncio.gather(*[cache.get(key, compute) for _ in range(5)])
+            results.append(await cache.get(key, compute))
+            return results
+        self.assertEqual(asyncio.run(run()), [["name"]] * 6)
+        self.assertEqual(len(calls), 1)
+
+    def test_key_depends_on_brackets(self):
+        self.assertNotEqual(template_key("Hi [name]", ("[", "]")), template_key("Hi [name]", ("<", ">")))
+
+if __name__ == "__main__":
+    unittest.main()